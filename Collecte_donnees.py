@@ -1,17 +1,24 @@
 """
 Collecteur Complet Smart City
-Collecte TOUS les polluants et indicateurs météo
+Collecte TOUS les polluants et indicateurs météo, pour chaque station de stations.json
 Génération automatique d'alertes
 """
 
-import requests
-import json
 import time
-import sqlite3
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
 from datetime import datetime
 import urllib3
+import os
 import random
-import schedule
+import db_pool
+import metrics
+import raw_payloads
+import retention
+import rollups
+import stations
+from scheduler import FixedRateScheduler
+from upstream import RateLimited, UpstreamClient
+from write_buffer import Batch, WriteBuffer
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -20,12 +27,26 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 # ========================================
 AQICN_KEY = "f2ead9da82c3b57265a4da4d6af31d876561e63c"
 OPENWEATHER_KEY = "02f6cb60a87c770ec8554c34959b46ff"
-CITY = "paris"
-LAT = 48.8566
-LON = 2.3522
 DB_NAME = "smartcity.db"
 
-INTERVAL_SECONDS= 1
+# Cadence de chaque source (secondes), ticks alignés sur l'horloge
+SOURCE_INTERVALS = {
+    'weather': 600,
+    'air_quality': 60,
+    'iot': 1,
+}
+# Tâche encore en cours au tick suivant : 'coalesce' (un rattrapage) ou 'skip'
+OVERRUN_POLICY = os.environ.get('SMARTCITY_OVERRUN_POLICY', 'coalesce')
+
+# Délai maximum d'un appel à chaque API externe (secondes, nouvelles tentatives comprises)
+SOURCE_TIMEOUTS = {
+    'air_quality': 10,
+    'weather': 10,
+}
+# Part de l'intervalle d'une source accordée à ses appels (toutes stations) : les appels
+# encore en attente d'un jeton du limiteur de débit au-delà sont reportés au cycle suivant
+FETCH_WINDOW = 0.8
+FETCH_WORKERS = int(os.environ.get('SMARTCITY_FETCH_WORKERS', 16))
 
 # Seuils d'alerte pour TOUS les polluants (µg/m³)
 THRESHOLDS = {
@@ -38,161 +59,182 @@ THRESHOLDS = {
     'nh3': 200     # Ammoniac
 }
 
+# ========================================
+# MÉTRIQUES (fichier metrics/collector.prom, exposé par /api/metrics)
+# ========================================
+collector_metrics = metrics.Registry()
+last_cycle = collector_metrics.gauge(
+    'smartcity_collector_last_cycle_timestamp_seconds', "Fin du dernier cycle de collecte (epoch)")
+
+# Sessions keep-alive, nouvelles tentatives et cache de fraîcheur (métriques upstream_*)
+upstream_client = UpstreamClient(collector_metrics, verify=False)
+
+# Écritures groupées : une transaction par vidage (taille ou délai), pas par mesure
+write_buffer = WriteBuffer(DB_NAME, registry=collector_metrics)
+
 print("=" * 70)
 print("COLLECTEUR SMART CITY COMPLET")
 print("=" * 70)
-print(f"Ville : {CITY}")
-print(f"Coordonnees : {LAT}, {LON}")
+print(f"Stations : {stations.STATIONS_FILE}")
 print("=" * 70)
 
+_stations = None
+
+def get_stations():
+    """Stations collectées (fichier ou table stations), chargées au premier appel"""
+    global _stations
+    if _stations is None:
+        _stations = stations.configure(DB_NAME)
+    return _stations
+
 # ========================================
 # FONCTIONS DE COLLECTE
 # ========================================
 
-def collect_air_quality():
-    """Collecte COMPLÈTE de la qualité de l'air avec TOUS les polluants"""
-    try:
-        url = f"https://api.waqi.info/feed/{CITY}/?token={AQICN_KEY}"
-        response = requests.get(url, timeout=10, verify=False)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data['status'] == 'ok':
-                conn = sqlite3.connect(DB_NAME)
-                cursor = conn.cursor()
-                
-                station = data['data']
-                iaqi = station.get('iaqi', {})
-                
-                # Récupérer TOUS les polluants
-                pm25 = iaqi.get('pm25', {}).get('v')
-                pm10 = iaqi.get('pm10', {}).get('v')
-                no2 = iaqi.get('no2', {}).get('v')
-                o3 = iaqi.get('o3', {}).get('v')
-                so2 = iaqi.get('so2', {}).get('v')
-                co = iaqi.get('co', {}).get('v')
-                nh3 = iaqi.get('nh3', {}).get('v')
-                aqi = station['aqi']
-                
-                # Insérer dans la base
-                cursor.execute('''
-                    INSERT INTO air_quality 
-                    (city, aqi, pm25, pm10, no2, o3, so2, co, nh3, station_name, raw_data)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    station['city']['name'], 
-                    aqi,
-                    pm25, pm10, no2, o3, so2, co, nh3,
-                    station['city']['name'], 
-                    json.dumps(data)
-                ))
-                
-                conn.commit()
-                
-                # Créer des alertes pour chaque polluant
-                pollutants_dict = {
-                    'pm25': pm25,
-                    'pm10': pm10,
-                    'no2': no2,
-                    'o3': o3,
-                    'so2': so2,
-                    'co': co,
-                    'nh3': nh3
-                }
-                
-                check_and_create_alerts(cursor, pollutants_dict, 'Zone Industrielle')
-                
-                conn.commit()
-                conn.close()
-                
-                # Afficher les polluants récupérés
-                print(f"  Polluants collectes:")
-                if pm25: print(f"     - PM2.5: {pm25} ug/m3")
-                if pm10: print(f"     - PM10: {pm10} ug/m3")
-                if no2: print(f"     - NO2: {no2} ug/m3")
-                if o3: print(f"     - O3: {o3} ug/m3")
-                if so2: print(f"     - SO2: {so2} ug/m3")
-                if co: print(f"     - CO: {co} ug/m3")
-                if nh3: print(f"     - NH3: {nh3} ug/m3")
-                
-                return True, aqi
-    except Exception as e:
-        print(f"  Erreur air quality: {str(e)}")
-    return False, None
+def now_epoch():
+    """Horodatage d'une mesure : (epoch UTC entier, texte UTC comme CURRENT_TIMESTAMP)"""
+    ts = int(time.time())
+    return ts, time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ts))
 
-def collect_weather():
-    """Collecte COMPLÈTE des données météo"""
-    try:
-        url = "https://api.openweathermap.org/data/2.5/weather"
-        params = {
-            'lat': LAT, 
-            'lon': LON,
-            'appid': OPENWEATHER_KEY,
-            'units': 'metric', 
-            'lang': 'fr'
-        }
-        response = requests.get(url, params=params, timeout=10, verify=False)
-        
-        if response.status_code == 200:
-            data = response.json()
-            
-            conn = sqlite3.connect(DB_NAME)
-            cursor = conn.cursor()
-            
-            # Récupérer TOUTES les données météo
-            temperature = data['main']['temp']
-            feels_like = data['main'].get('feels_like')
-            temp_min = data['main'].get('temp_min')
-            temp_max = data['main'].get('temp_max')
-            humidity = data['main']['humidity']
-            pressure = data['main']['pressure']
-            wind_speed = data['wind']['speed']
-            wind_direction = data['wind'].get('deg', 0)
-            clouds = data.get('clouds', {}).get('all', 0)
-            visibility = data.get('visibility', 0)
-            weather_main = data['weather'][0]['main']
-            weather_description = data['weather'][0]['description']
-            
-            cursor.execute('''
-                INSERT INTO weather 
-                (city, temperature, feels_like, temp_min, temp_max, humidity,
-                 pressure, wind_speed, wind_direction, clouds, visibility,
-                 weather_main, weather_description, raw_data)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                data['name'], 
-                temperature, 
-                feels_like,
-                temp_min, 
-                temp_max,
-                humidity, 
-                pressure,
-                wind_speed, 
-                wind_direction,
-                clouds, 
-                visibility,
-                weather_main, 
-                weather_description,
-                json.dumps(data)
-            ))
-            
-            conn.commit()
-            conn.close()
-            
-            # Afficher les données météo
-            print(f"  Meteo collectee:")
-            print(f"     - Temperature: {temperature}C (ressenti: {feels_like}C)")
-            print(f"     - Humidite: {humidity}%")
-            print(f"     - Pression: {pressure} hPa")
-            print(f"     - Vent: {wind_speed} m/s, direction: {wind_direction}")
-            print(f"     - Nuages: {clouds}%")
-            print(f"     - Visibilite: {visibility}m")
-            print(f"     - Conditions: {weather_description}")
-            
-            return True, temperature
-    except Exception as e:
-        print(f"  Erreur meteo: {str(e)}")
-    return False, None
+def fetch_air_quality(station, deadline=None):
+    """Appel WAQI d'une station : réponse JSON complète, ou None (erreur ou mesure déjà collectée)"""
+    url = f"https://api.waqi.info/feed/{station['waqi']}/"
+    data = upstream_client.get_json('waqi', url, params={'token': AQICN_KEY},
+                                    timeout=SOURCE_TIMEOUTS['air_quality'], deadline=deadline)
+    if data is not None and data['status'] == 'ok':
+        return data
+    return None
+
+def store_air_quality(cursor, data, station):
+    """Enregistrer TOUS les polluants d'une réponse WAQI et les alertes associées"""
+    feed = data['data']
+    iaqi = feed.get('iaqi', {})
+    
+    # Récupérer TOUS les polluants
+    pm25 = iaqi.get('pm25', {}).get('v')
+    pm10 = iaqi.get('pm10', {}).get('v')
+    no2 = iaqi.get('no2', {}).get('v')
+    o3 = iaqi.get('o3', {}).get('v')
+    so2 = iaqi.get('so2', {}).get('v')
+    co = iaqi.get('co', {}).get('v')
+    nh3 = iaqi.get('nh3', {}).get('v')
+    aqi = feed.get('aqi')
+    # Station sans indice courant : WAQI renvoie "aqi": "-" (stocké NULL, ignoré des agrégats)
+    if not isinstance(aqi, (int, float)):
+        aqi = None
+    ts, timestamp = now_epoch()
+    raw_hash = raw_payloads.stage(cursor, data)
+    
+    # Insérer dans la base
+    cursor.execute(f'''
+        INSERT INTO air_quality 
+        (timestamp, ts, station_id, city, aqi, pm25, pm10, no2, o3, so2, co, nh3, station_name, raw_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, {raw_payloads.ID_BY_HASH})
+    ''', (
+        timestamp, ts, station['id'],
+        feed['city']['name'], 
+        aqi,
+        pm25, pm10, no2, o3, so2, co, nh3,
+        feed['city']['name'], 
+        raw_hash
+    ))
+    
+    # Créer des alertes pour chaque polluant
+    pollutants_dict = {
+        'pm25': pm25,
+        'pm10': pm10,
+        'no2': no2,
+        'o3': o3,
+        'so2': so2,
+        'co': co,
+        'nh3': nh3
+    }
+    
+    rollups.record(cursor, 'city', feed['city']['name'], ts,
+                   dict(pollutants_dict, aqi=aqi))
+    rollups.record(cursor, 'station', station['id'], ts,
+                   dict(pollutants_dict, aqi=aqi))
+    
+    check_and_create_alerts(cursor, pollutants_dict, 'Zone Industrielle', station['id'])
+    
+    # Afficher les polluants récupérés
+    print(f"  Polluants collectes:")
+    if pm25: print(f"     - PM2.5: {pm25} ug/m3")
+    if pm10: print(f"     - PM10: {pm10} ug/m3")
+    if no2: print(f"     - NO2: {no2} ug/m3")
+    if o3: print(f"     - O3: {o3} ug/m3")
+    if so2: print(f"     - SO2: {so2} ug/m3")
+    if co: print(f"     - CO: {co} ug/m3")
+    if nh3: print(f"     - NH3: {nh3} ug/m3")
+    
+    return aqi
+
+def fetch_weather(station, deadline=None):
+    """Appel OpenWeather d'une station : réponse JSON complète, ou None (erreur ou observation déjà collectée)"""
+    url = "https://api.openweathermap.org/data/2.5/weather"
+    params = {
+        'lat': station['lat'], 
+        'lon': station['lon'],
+        'appid': OPENWEATHER_KEY,
+        'units': 'metric', 
+        'lang': 'fr'
+    }
+    return upstream_client.get_json('openweather', url, params=params,
+                                    timeout=SOURCE_TIMEOUTS['weather'], deadline=deadline)
+
+def store_weather(cursor, data, station):
+    """Enregistrer TOUTES les données météo d'une réponse OpenWeather"""
+    # Récupérer TOUTES les données météo
+    temperature = data['main']['temp']
+    feels_like = data['main'].get('feels_like')
+    temp_min = data['main'].get('temp_min')
+    temp_max = data['main'].get('temp_max')
+    humidity = data['main']['humidity']
+    pressure = data['main']['pressure']
+    wind_speed = data['wind']['speed']
+    wind_direction = data['wind'].get('deg', 0)
+    clouds = data.get('clouds', {}).get('all', 0)
+    visibility = data.get('visibility', 0)
+    weather_main = data['weather'][0]['main']
+    weather_description = data['weather'][0]['description']
+    ts, timestamp = now_epoch()
+    raw_hash = raw_payloads.stage(cursor, data)
+    
+    cursor.execute(f'''
+        INSERT INTO weather 
+        (timestamp, ts, station_id, city, temperature, feels_like, temp_min, temp_max, humidity,
+         pressure, wind_speed, wind_direction, clouds, visibility,
+         weather_main, weather_description, raw_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, {raw_payloads.ID_BY_HASH})
+    ''', (
+        timestamp, ts, station['id'],
+        data['name'], 
+        temperature, 
+        feels_like,
+        temp_min, 
+        temp_max,
+        humidity, 
+        pressure,
+        wind_speed, 
+        wind_direction,
+        clouds, 
+        visibility,
+        weather_main, 
+        weather_description,
+        raw_hash
+    ))
+    
+    # Afficher les données météo
+    print(f"  Meteo collectee:")
+    print(f"     - Temperature: {temperature}C (ressenti: {feels_like}C)")
+    print(f"     - Humidite: {humidity}%")
+    print(f"     - Pression: {pressure} hPa")
+    print(f"     - Vent: {wind_speed} m/s, direction: {wind_direction}")
+    print(f"     - Nuages: {clouds}%")
+    print(f"     - Visibilite: {visibility}m")
+    print(f"     - Conditions: {weather_description}")
+    
+    return temperature
 
 def simulate_iot():
     """Simule les capteurs IoT avec TOUS les polluants"""
@@ -202,38 +244,36 @@ def simulate_iot():
         ("SENSOR_03", "Est Paris", 48.8449, 2.3735)
     ]
     
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    
-    count = 0
+    readings = []
     for sensor_id, location, lat, lon in sensors:
-        try:
-            # Simuler tous les polluants
-            pm25 = round(random.uniform(5, 75), 1)
-            pm10 = round(pm25 * random.uniform(1.3, 1.8), 1)
-            no2 = round(random.uniform(10, 60), 1)
-            o3 = round(random.uniform(20, 150), 1)
-            so2 = round(random.uniform(5, 140), 1)
-            co = round(random.uniform(100, 15000), 1)
-            temp = round(random.uniform(10, 28), 1)
-            humidity = round(random.uniform(35, 85), 1)
-            
-            cursor.execute('''
-                INSERT INTO iot_sensors 
-                (sensor_id, location_name, location_lat, location_lon,
-                 pm25, pm10, no2, o3, so2, co, temperature, humidity)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (sensor_id, location, lat, lon, pm25, pm10, no2, o3, so2, co, temp, humidity))
-            count += 1
-        except Exception as e:
-            print(f"  Erreur capteur {sensor_id}: {str(e)}")
-            pass
+        # Simuler tous les polluants
+        pm25 = round(random.uniform(5, 75), 1)
+        pm10 = round(pm25 * random.uniform(1.3, 1.8), 1)
+        no2 = round(random.uniform(10, 60), 1)
+        o3 = round(random.uniform(20, 150), 1)
+        so2 = round(random.uniform(5, 140), 1)
+        co = round(random.uniform(100, 15000), 1)
+        temp = round(random.uniform(10, 28), 1)
+        humidity = round(random.uniform(35, 85), 1)
+        readings.append((sensor_id, location, lat, lon, pm25, pm10, no2, o3, so2, co, temp, humidity))
+    return readings
+
+def store_iot(cursor, readings):
+    ts, timestamp = now_epoch()
     
-    conn.commit()
-    conn.close()
-    return count
+    cursor.executemany('''
+        INSERT INTO iot_sensors 
+        (timestamp, ts, sensor_id, location_name, location_lat, location_lon,
+         pm25, pm10, no2, o3, so2, co, temperature, humidity)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(timestamp, ts) + reading for reading in readings])
+    for sensor_id, location, lat, lon, pm25, pm10, no2, o3, so2, co, temp, humidity in readings:
+        rollups.record(cursor, 'sensor', location, ts, {
+            'pm25': pm25, 'pm10': pm10, 'no2': no2, 'o3': o3, 'so2': so2, 'co': co
+        })
+    return len(readings)
 
-def check_and_create_alerts(cursor, pollutants, zone):
+def check_and_create_alerts(cursor, pollutants, zone, station_id=None):
     """Vérifier TOUS les seuils et créer des alertes"""
     zones_populations = {
         'Zone Industrielle': 15000,
@@ -251,6 +291,7 @@ def check_and_create_alerts(cursor, pollutants, zone):
         'nh3': 'NH3 (Ammoniac)'
     }
     
+    ts, timestamp = now_epoch()
     for pollutant, value in pollutants.items():
         if value is None:
             continue
@@ -276,28 +317,29 @@ def check_and_create_alerts(cursor, pollutants, zone):
         
         # Créer l'alerte
         cursor.execute('''
-            INSERT INTO alerts (type, zone, level, message, value, threshold, population)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO alerts (timestamp, ts, type, zone, level, message, value, threshold, population, station_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
+            timestamp, ts,
             pollutant_name,
             zone,
             level,
             message,
             value,
             threshold,
-            zones_populations.get(zone, 10000)
+            zones_populations.get(zone, 10000),
+            station_id
         ))
 
-def create_prediction_alert():
+def create_prediction_alert(cursor):
     """Créer une alerte de prédiction météo"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    
     if random.random() > 0.7:
+        ts, timestamp = now_epoch()
         cursor.execute('''
-            INSERT INTO alerts (type, zone, level, message, value, threshold, population)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO alerts (timestamp, ts, type, zone, level, message, value, threshold, population)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
+            timestamp, ts,
             'Prédiction',
             'Pic de pollution probable',
             'Important',
@@ -306,54 +348,131 @@ def create_prediction_alert():
             None,
             None
         ))
-        conn.commit()
+
+# ========================================
+# CYCLE DE COLLECTE
+# ========================================
+
+FETCHERS = {
+    'air_quality': fetch_air_quality,
+    'weather': fetch_weather,
+}
+# Un pool par source : les appels d'une source en attente de jetons ne bloquent pas l'autre
+fetch_pools = {source: ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix=f'collecte-{source}')
+               for source in FETCHERS}
+
+def fetch_all(sources, started):
+    """Appels externes en parallèle pour toutes les stations ; génère (source, station, réponse JSON)
+
+    Les réponses sont rendues dans l'ordre d'arrivée. Chaque source dispose de FETCH_WINDOW
+    de son intervalle pour obtenir ses jetons, plus le délai d'un appel : au-delà, les
+    appels restants sont abandonnés (les stations concernées passent au cycle suivant).
+    """
+    futures = {}
+    end = started
+    for source, fetch in FETCHERS.items():
+        if source not in sources:
+            continue
+        deadline = started + SOURCE_INTERVALS[source] * FETCH_WINDOW
+        end = max(end, deadline + SOURCE_TIMEOUTS[source])
+        for station in get_stations():
+            futures[fetch_pools[source].submit(fetch, station, deadline)] = (source, station)
     
-    conn.close()
+    throttled = 0
+    try:
+        for future in as_completed(futures, timeout=max(0, end - time.monotonic())):
+            source, station = futures[future]
+            try:
+                data = future.result()
+            except RateLimited:
+                throttled += 1
+                continue
+            except Exception as e:
+                print(f"  Erreur {source} ({station['id']}): {str(e)}")
+                continue
+            if data is not None:
+                yield source, station, data
+    except FutureTimeoutError:
+        late = [future for future in futures if not future.done()]
+        for future in late:
+            future.cancel()
+        print(f"  Delai depasse : {len(late)} appel(s) abandonne(s)")
+    if throttled:
+        print(f"  Limite de debit : {throttled} appel(s) reporte(s) au cycle suivant")
 
-def collect_once():
-    """Lance une collecte COMPLETE"""
+def store_source(name, store, *args):
+    """Préparer les lignes d'une source dans un lot : une erreur n'écarte qu'elle"""
+    batch = Batch()
+    try:
+        result = store(batch, *args)
+    except Exception as e:
+        print(f"  Erreur {name}: {str(e)}")
+        return None
+    write_buffer.add(batch)
+    return result
+
+def collect(sources=tuple(SOURCE_INTERVALS)):
+    """Collecte des sources demandées (air_quality, weather, iot)"""
     now = datetime.now().strftime('%H:%M:%S')
-    print(f"\n[{now}] Collecte en cours...")
+    print(f"\n[{now}] Collecte en cours ({', '.join(sources)})...")
     print("=" * 70)
     
-    # 1. Qualité de l'air
-    air_ok, aqi = collect_air_quality()
-    if air_ok:
-        print(f"  Air quality - AQI: {aqi}")
-    
-    time.sleep(2)
-    
-    # 2. Météo
-    weather_ok, temp = collect_weather()
-    if weather_ok:
-        print(f"  Meteo complete collectee")
-    
-    time.sleep(2)
+    # 1-2. Qualité de l'air et météo, toutes stations en parallèle ; chaque réponse passe
+    # au tampon d'écriture dès son arrivée (écrit par lots, taille ou délai)
+    for source, station, data in fetch_all(sources, time.monotonic()):
+        if source == 'air_quality':
+            aqi = store_source(f"air quality {station['id']}", store_air_quality, data, station)
+            if aqi is not None:
+                print(f"  Air quality {station['id']} - AQI: {aqi}")
+        elif store_source(f"meteo {station['id']}", store_weather, data, station) is not None:
+            print(f"  Meteo complete collectee ({station['id']})")
     
     # 3. Capteurs IoT
-    iot_count = simulate_iot()
-    print(f"  IoT - {iot_count} capteurs simules avec tous les polluants")
+    readings = simulate_iot() if 'iot' in sources else None
+    if readings is not None:
+        iot_count = store_source('IoT', store_iot, readings) or 0
+        print(f"  IoT - {iot_count} capteurs simules avec tous les polluants")
     
-    # 4. Alertes prédiction
-    create_prediction_alert()
+    # 4. Alertes prédiction (suivent les conditions météo)
+    if 'weather' in sources:
+        store_source('prediction', create_prediction_alert)
     
-    # Statistiques
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(*) FROM air_quality')
-    total_air = cursor.fetchone()[0]
-    cursor.execute('SELECT COUNT(*) FROM weather')
-    total_weather = cursor.fetchone()[0]
-    cursor.execute('SELECT COUNT(*) FROM alerts WHERE status = "active"')
-    total_alerts = cursor.fetchone()[0]
-    conn.close()
+    # Sources lentes (météo, qualité de l'air, alertes) visibles sans attendre le délai ;
+    # les capteurs IoT (chaque seconde) sont regroupés par le tampon
+    if set(sources) - {'iot'}:
+        write_buffer.flush()
     
-    print("=" * 70)
-    print(f"  TOTAL EN BASE:")
-    print(f"     - Air quality: {total_air} enregistrements")
-    print(f"     - Meteo: {total_weather} enregistrements")
-    print(f"     - Alertes actives: {total_alerts}")
-    print("=" * 70)
+    # Statistiques (au rythme de la qualité de l'air, pas à chaque seconde)
+    if 'air_quality' in sources:
+        conn = db_pool.connect(DB_NAME)
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM air_quality')
+        total_air = cursor.fetchone()[0]
+        cursor.execute('SELECT COUNT(*) FROM weather')
+        total_weather = cursor.fetchone()[0]
+        cursor.execute('SELECT COUNT(*) FROM alerts WHERE status = "active"')
+        total_alerts = cursor.fetchone()[0]
+        conn.close()
+        
+        print("=" * 70)
+        print(f"  TOTAL EN BASE:")
+        print(f"     - Air quality: {total_air} enregistrements")
+        print(f"     - Meteo: {total_weather} enregistrements")
+        print(f"     - Alertes actives: {total_alerts}")
+        print("=" * 70)
+
+    # Rendre au pool une connexion restée ouverte après une erreur
+    db_pool.release_current(DB_NAME)
+
+    last_cycle.set(time.time())
+    try:
+        metrics.write_textfile(collector_metrics, 'collector')
+    except OSError as e:
+        print(f"  Erreur export metriques: {e}")
+
+def collect_once():
+    """Lance une collecte COMPLETE"""
+    collect(tuple(SOURCE_INTERVALS))
 
 # ========================================
 # PROGRAMME PRINCIPAL
@@ -367,22 +486,31 @@ def main():
     print("   - Capteurs IoT : 3 zones simulees")
     print("   - Alertes : Generation automatique\n")
 
+    station_list = get_stations()
+    cities = sorted({station['city'] for station in station_list})
+    print(f"Stations suivies : {len(station_list)} ({', '.join(cities)})")
+    
     # Premiere collecte
     print("Premiere collecte immediate...")
     collect_once()
     
-    # Programmer les collectes
-    schedule.every(INTERVAL_SECONDS).seconds.do(collect_once)
+    # Purge et compactage en tâche de fond (petites transactions)
+    retention.start_worker(DB_NAME)
+    write_buffer.start()
+    
+    # Programmer les collectes : une tâche par source, à cadence fixe
+    scheduler = FixedRateScheduler(collector_metrics)
+    for source, interval in SOURCE_INTERVALS.items():
+        scheduler.add(source, interval, lambda source=source: collect((source,)), OVERRUN_POLICY)
+        print(f"Collecte {source} programmee toutes les {interval} seconde(s)")
     
-    print(f"\nCollecte automatique programmee toutes les {INTERVAL_SECONDS} seconde(s)")
-    print("Le dashboard se mettra a jour automatiquement")
+    print("\nLe dashboard se mettra a jour automatiquement")
     print("Appuyez sur Ctrl+C pour arreter\n")
     
     try:
-        while True:
-            schedule.run_pending()
-            time.sleep(5)
+        scheduler.run_forever()
     except KeyboardInterrupt:
+        write_buffer.close()
         print("\n\n⛔ Collecteur arrêté")
         print("👋 Au revoir !")
 
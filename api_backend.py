@@ -4,21 +4,49 @@ Tous les endpoints fonctionnels avec gestion des filtres
 Port : 5173
 """
 
-from flask import Flask, jsonify, request, send_file
+from flask import Flask, jsonify, request, send_file, make_response, Response, stream_with_context, g, has_request_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import sqlite3
-from datetime import datetime, timedelta
-import json
+from datetime import datetime, timedelta, timezone
+import time
 import hashlib
 import secrets
 from functools import wraps
-import os
 from io import BytesIO
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
 from reportlab.lib.units import inch
+import db_pool
+import metrics
+import raw_payloads
+import rollups
+import stations
+from downsampling import bucketed_series, clamp_max_points
+from latest_snapshot import LatestSnapshot
+from live_stream import ChangeBroadcaster
+from http_conditional import finalize_response, make_etag
+from export_stream import EXPORT_FORMATS, export_columns, export_stream
+from report_jobs import ReportJobs, STATUS_DONE
+from predictions_provider import PredictionsProvider
+from query_stats import QueryStats, TOP_N
+from session_cache import SessionCache, start_sweeper
+from migrations import apply_migrations
+from response_cache import ResponseCache
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Sérialisation JSON de Flask, chronométrée par requête"""
+
+    def dumps(self, obj, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            if has_request_context():
+                g.serialization_seconds = g.get('serialization_seconds', 0.0) + time.perf_counter() - started
 
 app = Flask(__name__)
+app.json = TimedJSONProvider(app)
 
 CORS(app, resources={
     r"/api/*": {
@@ -29,40 +57,230 @@ CORS(app, resources={
 })
 
 DB_NAME = "smartcity.db"
+# Durée de validité d'un ticket du flux SSE (usage unique)
+STREAM_TICKET_SECONDS = 30
+
+session_cache = SessionCache()
+response_cache = ResponseCache()
+latest_snapshot = LatestSnapshot()
+broadcaster = ChangeBroadcaster(DB_NAME)
+predictions_provider = PredictionsProvider('predictions_24h.json')
+query_stats = QueryStats()
+db_pool.query_observers.append(query_stats.record)
+
+# ========================================
+# MÉTRIQUES
+# ========================================
+metrics_registry = metrics.Registry()
+http_requests = metrics_registry.counter(
+    'smartcity_http_requests_total', "Requetes HTTP traitees", ('method', 'route', 'status'))
+http_latency = metrics_registry.histogram(
+    'smartcity_http_request_duration_seconds',
+    "Duree de traitement jusqu'a l'envoi des en-tetes", ('method', 'route'))
+http_in_flight = metrics_registry.gauge(
+    'smartcity_http_requests_in_flight', "Requetes en cours (flux SSE et exports compris)")
+http_response_bytes = metrics_registry.histogram(
+    'smartcity_http_response_bytes', "Taille des corps de reponse envoyes (apres compression)",
+    ('route',), buckets=metrics.BYTES_BUCKETS)
+http_sqlite_time = metrics_registry.histogram(
+    'smartcity_http_sqlite_seconds', "Temps passe dans SQLite par requete", ('route',))
+http_serialization_time = metrics_registry.histogram(
+    'smartcity_http_serialization_seconds', "Temps de serialisation JSON par requete", ('route',))
+
+# Nom du fichier de métriques de ce processus quand plusieurs workers publient les leurs
+metrics_textfile = None
+
+def start_metrics_export(name):
+    """Multi-processus : publier les métriques de ce worker (label worker) pour /api/metrics"""
+    global metrics_textfile
+    metrics_textfile = name
+    metrics_registry.const_labels['worker'] = name
+    metrics.start_textfile_exporter(metrics_registry, name)
+
+def record_request_metrics(response):
+    started = g.get('metrics_started')
+    if started is None:
+        return
+    route = request.url_rule.rule if request.url_rule is not None else 'inconnue'
+    http_requests.inc(request.method, route, response.status_code)
+    http_latency.observe(time.perf_counter() - started, request.method, route)
+    http_sqlite_time.observe(db_pool.sql_time() - g.sql_started, route)
+    http_serialization_time.observe(g.get('serialization_seconds', 0.0), route)
+    if response.content_length is not None:
+        http_response_bytes.observe(response.content_length, route)
 
 def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db_pool.connect(DB_NAME, row_factory=sqlite3.Row)
+
+@app.before_request
+def start_request_metrics():
+    if request.path.startswith('/api/'):
+        g.metrics_started = time.perf_counter()
+        g.sql_started = db_pool.sql_time()
+        http_in_flight.inc()
+
+@app.after_request
+def conditional_response(response):
+    if request.path.startswith('/api/'):
+        response = finalize_response(request, response)
+        record_request_metrics(response)
+    return response
+
+@app.teardown_request
+def release_db_connection(exc):
+    if g.pop('metrics_started', None) is not None:
+        http_in_flight.dec()
+    db_pool.release_current(DB_NAME)
 
 def dict_from_row(row):
     return dict(zip(row.keys(), row))
 
+def since_epoch(hours):
+    """Borne basse (epoch UTC) d'une fenêtre glissante de N heures"""
+    return int(time.time()) - hours * 3600
+
+def parse_epoch(value):
+    """Epoch UTC depuis un entier ou une date ISO 8601 (UTC si sans fuseau)"""
+    if value is None or value == '':
+        return None
+    if value.lstrip('-').isdigit():
+        return int(value)
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+def requested_stations():
+    """Stations demandées par ?city= / ?station= : identifiants, ou None sans filtre
+
+    LookupError si le filtre ne correspond à aucune station connue.
+    """
+    conn = get_db_connection()
+    try:
+        station_ids = stations.resolve(conn.cursor(), request.args.get('city'), request.args.get('station'))
+    finally:
+        conn.close()
+    if station_ids == []:
+        raise LookupError("Ville ou station inconnue")
+    return station_ids
+
+def current_data_version():
+    conn = get_db_connection()
+    try:
+        return db_pool.get_data_version(conn)
+    finally:
+        conn.close()
+
+def latest_readings():
+    """Miroir mémoire des dernières mesures, rechargé si la génération a changé"""
+    conn = get_db_connection()
+    try:
+        latest_snapshot.refresh(conn, db_pool.get_data_version(conn))
+    finally:
+        conn.close()
+    return latest_snapshot
+
+def cached_response(endpoint, params=()):
+    """Servir la réponse JSON depuis le cache tant que la génération des données n'a pas changé"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            key = (endpoint,) + tuple(request.args.get(name) for name in params)
+            version = current_data_version()
+            computed = []
+            
+            def compute():
+                response = make_response(f(*args, **kwargs))
+                computed.append(response)
+                body = response.get_data()
+                return (body, make_etag(body, version)), response.status_code == 200
+            
+            # Succès / échecs déjà comptés par le cache (hits, misses)
+            (body, etag), _ = response_cache.get_or_compute(key, version, compute)
+            response = computed[0] if computed else app.response_class(body, mimetype='application/json')
+            if response.status_code == 200:
+                response.set_etag(etag)
+            return response
+        return decorated_function
+    return decorator
+
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
 def generate_token():
     return secrets.token_hex(32)
 
-def require_auth(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        token = request.headers.get('Authorization')
-        if not token:
-            return jsonify({"success": False, "message": "Token manquant"}), 401
-        
-        token = token.replace('Bearer ', '')
+def lookup_session(token):
+    """user_id de la session valide associée au jeton, ou None"""
+    user_id = session_cache.get(token)
+    if user_id is None:
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT user_id FROM sessions WHERE token = ? AND expires_at > ?', 
+        cursor.execute('SELECT user_id, expires_at FROM sessions WHERE token = ? AND expires_at > ?', 
                       (token, datetime.now().isoformat()))
         session = cursor.fetchone()
         conn.close()
         
         if not session:
+            return None
+        
+        user_id = session['user_id']
+        session_cache.put(token, user_id, session['expires_at'])
+    return user_id
+
+def issue_stream_ticket(user_id):
+    """Ticket à usage unique et courte durée pour l'URL EventSource"""
+    ticket = generate_token()
+    now = datetime.now()
+    conn = get_db_connection()
+    try:
+        conn.execute('DELETE FROM stream_tickets WHERE expires_at <= ?', (now.isoformat(),))
+        conn.execute('INSERT INTO stream_tickets (ticket, user_id, expires_at) VALUES (?, ?, ?)',
+                     (ticket, user_id, (now + timedelta(seconds=STREAM_TICKET_SECONDS)).isoformat()))
+        conn.commit()
+    finally:
+        conn.close()
+    return ticket
+
+def consume_stream_ticket(ticket):
+    """user_id du ticket valide, qui est supprimé au passage (None si inconnu, expiré ou déjà utilisé)"""
+    conn = get_db_connection()
+    try:
+        row = conn.execute('SELECT user_id FROM stream_tickets WHERE ticket = ? AND expires_at > ?',
+                           (ticket, datetime.now().isoformat())).fetchone()
+        if row is None:
+            return None
+        # Un seul consommateur obtient la suppression, même entre processus
+        deleted = conn.execute('DELETE FROM stream_tickets WHERE ticket = ?', (ticket,)).rowcount
+        conn.commit()
+    finally:
+        conn.close()
+    return row['user_id'] if deleted == 1 else None
+
+def require_auth(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = request.headers.get('Authorization')
+        if not token:
+            return jsonify({"success": False, "message": "Token manquant"}), 401
+        
+        user_id = lookup_session(token.replace('Bearer ', ''))
+        if user_id is None:
             return jsonify({"success": False, "message": "Session invalide"}), 401
         
-        request.user_id = session['user_id']
+        request.user_id = user_id
+        return f(*args, **kwargs)
+    return decorated_function
+
+def require_admin(f):
+    """À placer après @require_auth"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        conn = get_db_connection()
+        user = conn.execute('SELECT role FROM users WHERE id = ?', (request.user_id,)).fetchone()
+        conn.close()
+        if user is None or user['role'] != 'admin':
+            return jsonify({"success": False, "message": "Acces reserve aux administrateurs"}), 403
         return f(*args, **kwargs)
     return decorated_function
 
@@ -92,6 +310,18 @@ def init_database():
         )
     ''')
     
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (expires_at)')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stream_tickets (
+            ticket TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            expires_at DATETIME NOT NULL
+        )
+    ''')
+    
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_stream_tickets_expires_at ON stream_tickets (expires_at)')
+    
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS air_quality (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -106,7 +336,7 @@ def init_database():
             co REAL,
             nh3 REAL,
             station_name TEXT,
-            raw_data TEXT
+            raw_id INTEGER
         )
     ''')
     
@@ -127,7 +357,7 @@ def init_database():
             visibility INTEGER,
             weather_main TEXT,
             weather_description TEXT,
-            raw_data TEXT
+            raw_id INTEGER
         )
     ''')
     
@@ -179,6 +409,7 @@ def init_database():
         ''', ('Marie Dubois', 'marie.dubois@smartcity.com', hash_password('password123'), 'user'))
     
     conn.commit()
+    apply_migrations(conn)
     conn.close()
     print("Base de donnees initialisee")
 
@@ -228,6 +459,7 @@ def login():
 @require_auth
 def logout():
     token = request.headers.get('Authorization').replace('Bearer ', '')
+    session_cache.invalidate(token)
     
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -245,13 +477,44 @@ def health_check():
         "timestamp": datetime.now().isoformat()
     })
 
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Exposition Prometheus : ce processus, le collecteur et les autres workers"""
+    body = metrics.merge_expositions(
+        [metrics_registry.render()] + metrics.read_textfiles(exclude=metrics_textfile))
+    return Response(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/admin/queries', methods=['GET', 'DELETE'])
+@require_auth
+@require_admin
+def get_query_stats():
+    """Requêtes SQL les plus coûteuses de ce processus (DELETE : remise à zéro)"""
+    if request.method == 'DELETE':
+        query_stats.reset()
+        return jsonify({"success": True})
+    limit = request.args.get('limit', TOP_N, type=int)
+    return jsonify({
+        "success": True,
+        "threshold_ms": query_stats.threshold * 1000,
+        "queries": query_stats.top(max(1, min(limit, 200)))
+    })
+
 @app.route('/api/dashboard', methods=['GET'])
 @require_auth
+@cached_response('dashboard', ('period', 'zone', 'pollutant', 'max_points', 'city', 'station'))
 def get_dashboard_data():
     try:
+        station_ids = requested_stations()
         period = request.args.get('period', '24h')
         zone = request.args.get('zone', 'toutes')
         pollutant = request.args.get('pollutant', 'pm25')
+        max_points = clamp_max_points(request.args.get('max_points'))
+        
+        air_columns = ['aqi', 'pm25', 'pm10', 'no2', 'o3', 'so2', 'co']
+        if pollutant not in air_columns + ['nh3']:
+            return jsonify({"success": False, "message": f"Polluant inconnu: {pollutant}"}), 400
+        if pollutant not in air_columns:
+            air_columns.append(pollutant)
         
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -259,61 +522,26 @@ def get_dashboard_data():
         hours_map = {'1h': 1, '6h': 6, '24h': 24, '7d': 168}
         hours = hours_map.get(period, 24)
         
-        cursor.execute('SELECT * FROM air_quality ORDER BY timestamp DESC LIMIT 1')
-        air_quality_row = cursor.fetchone()
-        air_quality = dict_from_row(air_quality_row) if air_quality_row else None
-        
-        cursor.execute('SELECT * FROM weather ORDER BY timestamp DESC LIMIT 1')
-        weather_row = cursor.fetchone()
-        weather = dict_from_row(weather_row) if weather_row else None
-        
-        if zone == 'toutes':
-            cursor.execute('''
-                SELECT * FROM iot_sensors 
-                WHERE id IN (
-                    SELECT MAX(id) FROM iot_sensors 
-                    GROUP BY sensor_id
-                )
-                ORDER BY sensor_id
-            ''')
-        else:
+        latest = latest_readings()
+        air_quality = latest.latest('air_quality', station_ids)
+        weather = latest.latest('weather', station_ids)
+        
+        iot_sensors = latest.all('iot_sensors')
+        if zone != 'toutes':
             zone_map = {
                 'centre': 'Centre-ville',
                 'industrielle': 'Zone Industrielle',
                 'residentiel': 'Résidentiel Nord'
             }
-            cursor.execute('''
-                SELECT * FROM iot_sensors 
-                WHERE location_name = ? AND id IN (
-                    SELECT MAX(id) FROM iot_sensors 
-                    WHERE location_name = ?
-                    GROUP BY sensor_id
-                )
-                ORDER BY sensor_id
-            ''', (zone_map.get(zone, zone), zone_map.get(zone, zone)))
-        
-        iot_sensors_rows = cursor.fetchall()
-        iot_sensors = [dict_from_row(row) for row in iot_sensors_rows]
+            location = zone_map.get(zone, zone)
+            iot_sensors = [sensor for sensor in iot_sensors if sensor['location_name'] == location]
         
-        cursor.execute(f'''
-            SELECT 
-                strftime('%H:%M', timestamp) as time,
-                aqi, pm25, pm10, no2, o3, so2, co, {pollutant}
-            FROM air_quality 
-            WHERE timestamp >= datetime('now', '-{hours} hours')
-            ORDER BY timestamp ASC
-        ''')
-        air_history = [dict_from_row(row) for row in cursor.fetchall()]
+        air_history = bucketed_series(cursor, 'air_quality', air_columns,
+                                      since_epoch(hours), max_points, pollutant, station_ids)
         
-        cursor.execute(f'''
-            SELECT 
-                strftime('%H:%M', timestamp) as time,
-                temperature, humidity, wind_speed, pressure
-            FROM weather 
-            WHERE timestamp >= datetime('now', '-{hours} hours')
-            ORDER BY timestamp ASC
-        ''')
-        weather_history = [dict_from_row(row) for row in cursor.fetchall()]
+        weather_history = bucketed_series(cursor, 'weather',
+                                          ['temperature', 'humidity', 'wind_speed', 'pressure'],
+                                          since_epoch(hours), max_points, 'temperature', station_ids)
         
         conn.close()
         
@@ -332,63 +560,172 @@ def get_dashboard_data():
                 "filters": {
                     "period": period,
                     "zone": zone,
-                    "pollutant": pollutant
+                    "pollutant": pollutant,
+                    "max_points": max_points,
+                    "city": request.args.get('city'),
+                    "station": request.args.get('station')
                 }
             }
         })
+    except LookupError as e:
+        return jsonify({"success": False, "message": str(e)}), 404
     except Exception as e:
         print(f"Erreur dashboard: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/api/stream/ticket', methods=['POST'])
+@require_auth
+def create_stream_ticket():
+    return jsonify({
+        "success": True,
+        "ticket": issue_stream_ticket(request.user_id),
+        "expires_in": STREAM_TICKET_SECONDS
+    })
+
+@app.route('/api/stream', methods=['GET'])
+def stream_live_data():
+    # EventSource ne peut pas envoyer d'en-tête : ticket à usage unique en paramètre
+    # (POST /api/stream/ticket). Jamais le jeton de session : l'URL finit dans les journaux d'accès
+    token = request.headers.get('Authorization')
+    ticket = request.args.get('ticket')
+    if token:
+        user_id = lookup_session(token.replace('Bearer ', ''))
+    elif ticket:
+        user_id = consume_stream_ticket(ticket)
+    else:
+        return jsonify({"success": False, "message": "Token manquant"}), 401
+    if user_id is None:
+        return jsonify({"success": False, "message": "Session invalide"}), 401
+    
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    response = Response(stream_with_context(broadcaster.stream(last_event_id)),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+ALERT_FILTERS = ('status', 'zone', 'level', 'type', 'since', 'until', 'city', 'station')
+
+def alert_filters():
+    """Clause WHERE et paramètres des filtres d'alertes (ValueError si invalide, LookupError si station inconnue)"""
+    clauses = []
+    params = []
+    
+    status = request.args.get('status', 'active')
+    if status != 'toutes':
+        clauses.append('status = ?')
+        params.append(status)
+    for column in ('zone', 'level', 'type'):
+        value = request.args.get(column)
+        if value:
+            clauses.append(f'{column} = ?')
+            params.append(value)
+    
+    station_ids = requested_stations()
+    if station_ids is not None:
+        clauses.append(f"station_id IN ({', '.join('?' for _ in station_ids)})")
+        params.extend(station_ids)
+    
+    since = parse_epoch(request.args.get('since'))
+    if since is not None:
+        clauses.append('ts >= ?')
+        params.append(since)
+    until = parse_epoch(request.args.get('until'))
+    if until is not None:
+        clauses.append('ts < ?')
+        params.append(until)
+    
+    return clauses, params
+
 @app.route('/api/alerts', methods=['GET'])
 @require_auth
+@cached_response('alerts', ALERT_FILTERS + ('limit', 'cursor'))
 def get_alerts():
     try:
+        try:
+            clauses, params = alert_filters()
+            limit = max(1, min(500, int(request.args.get('limit', 50))))
+            
+            # Curseur keyset "ts-id" : la page suivante démarre strictement après
+            page_cursor = request.args.get('cursor')
+            if page_cursor:
+                cursor_ts, cursor_id = (int(part) for part in page_cursor.split('-', 1))
+                clauses.append('(ts, id) < (?, ?)')
+                params.extend([cursor_ts, cursor_id])
+        except ValueError:
+            return jsonify({"success": False, "message": "Filtre ou curseur invalide"}), 400
+        except LookupError as e:
+            return jsonify({"success": False, "message": str(e)}), 404
+        
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute('''
+        cursor.execute(f'''
             SELECT * FROM alerts 
-            WHERE status = 'active'
-            ORDER BY timestamp DESC
-            LIMIT 50
-        ''')
+            {where}
+            ORDER BY ts DESC, id DESC
+            LIMIT ?
+        ''', params + [limit + 1])
         
         alerts = [dict_from_row(row) for row in cursor.fetchall()]
         conn.close()
         
+        next_cursor = None
+        if len(alerts) > limit:
+            alerts = alerts[:limit]
+            next_cursor = f"{alerts[-1]['ts']}-{alerts[-1]['id']}"
+        
         return jsonify({
             "success": True,
             "count": len(alerts),
-            "alerts": alerts
+            "alerts": alerts,
+            "next_cursor": next_cursor
         })
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
-@app.route('/api/sensors/current', methods=['GET'])
+@app.route('/api/alerts/count', methods=['GET'])
 @require_auth
-def get_current_sensors():
+@cached_response('alerts_count', ALERT_FILTERS)
+def count_alerts():
     try:
+        try:
+            clauses, params = alert_filters()
+        except ValueError:
+            return jsonify({"success": False, "message": "Filtre invalide"}), 400
+        except LookupError as e:
+            return jsonify({"success": False, "message": str(e)}), 404
+        
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        
         conn = get_db_connection()
         cursor = conn.cursor()
+        cursor.execute(f'SELECT COUNT(*) as count FROM alerts {where}', params)
+        count = cursor.fetchone()['count']
+        conn.close()
         
-        cursor.execute('SELECT aqi FROM air_quality ORDER BY timestamp DESC LIMIT 1')
-        aqi_row = cursor.fetchone()
+        return jsonify({
+            "success": True,
+            "count": count
+        })
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/sensors/current', methods=['GET'])
+@require_auth
+def get_current_sensors():
+    try:
+        station_ids = requested_stations()
+        latest = latest_readings()
+        aqi_row = latest.latest('air_quality', station_ids)
         aqi = aqi_row['aqi'] if aqi_row else 0
         
-        cursor.execute('SELECT temperature FROM weather ORDER BY timestamp DESC LIMIT 1')
-        temp_row = cursor.fetchone()
-        temperature = temp_row['temperature'] if temp_row else 0
-        
-        cursor.execute('SELECT humidity FROM weather ORDER BY timestamp DESC LIMIT 1')
-        hum_row = cursor.fetchone()
-        humidity = hum_row['humidity'] if hum_row else 0
-        
-        cursor.execute('SELECT wind_speed FROM weather ORDER BY timestamp DESC LIMIT 1')
-        wind_row = cursor.fetchone()
-        wind_speed = wind_row['wind_speed'] if wind_row else 0
-        
-        conn.close()
+        weather_row = latest.latest('weather', station_ids)
+        temperature = weather_row['temperature'] if weather_row else 0
+        humidity = weather_row['humidity'] if weather_row else 0
+        wind_speed = weather_row['wind_speed'] if weather_row else 0
         
         return jsonify({
             "success": True,
@@ -399,13 +736,33 @@ def get_current_sensors():
                 "wind_speed": round(wind_speed, 1)
             }
         })
+    except LookupError as e:
+        return jsonify({"success": False, "message": str(e)}), 404
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/stations', methods=['GET'])
+@require_auth
+def get_stations():
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        station_list = stations.list_all(cursor)
+        conn.close()
+        return jsonify({
+            "success": True,
+            "count": len(station_list),
+            "stations": station_list
+        })
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route('/api/statistics', methods=['GET'])
 @require_auth
+@cached_response('statistics', ('period', 'city', 'station'))
 def get_statistics():
     try:
+        station_ids = requested_stations()
         period = request.args.get('period', '24h')
         hours_map = {'1h': 1, '6h': 6, '24h': 24, '7d': 168}
         hours = hours_map.get(period, 24)
@@ -413,20 +770,11 @@ def get_statistics():
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute(f'''
-            SELECT 
-                AVG(pm25) as avg_pm25,
-                AVG(pm10) as avg_pm10,
-                AVG(no2) as avg_no2,
-                AVG(o3) as avg_o3,
-                AVG(so2) as avg_so2,
-                AVG(co) as avg_co,
-                AVG(aqi) as avg_aqi
-            FROM air_quality
-            WHERE timestamp >= datetime('now', '-{hours} hours')
-        ''')
-        
-        stats = dict_from_row(cursor.fetchone())
+        # Filtre : cumul des seules stations retenues (portée station), sinon toute la ville
+        scope = 'city' if station_ids is None else 'station'
+        aggregates = rollups.aggregate(cursor, scope, since_epoch(hours), int(time.time()) + 1,
+                                       ('pm25', 'pm10', 'no2', 'o3', 'so2', 'co', 'aqi'), station_ids)
+        stats = {f'avg_{name}': values['avg'] for name, values in aggregates.items()}
         conn.close()
         
         return jsonify({
@@ -441,6 +789,8 @@ def get_statistics():
                 "aqi": round(stats['avg_aqi'] or 0, 0)
             }
         })
+    except LookupError as e:
+        return jsonify({"success": False, "message": str(e)}), 404
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -448,25 +798,8 @@ def get_statistics():
 @require_auth
 def get_predictions():
     try:
-        predictions_file = 'predictions_24h.json'
-        
-        if os.path.exists(predictions_file):
-            with open(predictions_file, 'r', encoding='utf-8') as f:
-                predictions = json.load(f)
-        else:
-            predictions = []
-            now = datetime.now()
-            for i in range(24):
-                pred_time = now + timedelta(hours=i+1)
-                predictions.append({
-                    "time": pred_time.strftime('%H:%M'),
-                    "timestamp": pred_time.isoformat(),
-                    "aqi": 45 + (i % 10),
-                    "pm25": 35.0 + (i % 8),
-                    "confidence": 95 - (i * 2),
-                    "level": "BON" if (45 + (i % 10)) < 50 else "MODÉRÉ",
-                    "level_class": "success" if (45 + (i % 10)) < 50 else "warning"
-                })
+        snapshot = predictions_provider.get()
+        predictions = snapshot.predictions
         
         model_info = {
             "model": "Random Forest",
@@ -476,7 +809,7 @@ def get_predictions():
             "tendance": "stable"
         }
         
-        return jsonify({
+        response = jsonify({
             "success": True,
             "data": {
                 "predictions": predictions,
@@ -487,12 +820,15 @@ def get_predictions():
                 "tendance": model_info["tendance"]
             }
         })
+        response.set_etag(f"predictions-{snapshot.version}")
+        return response
     except Exception as e:
         print(f"Erreur prédictions: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route('/api/zones', methods=['GET'])
 @require_auth
+@cached_response('zones')
 def get_zones():
     try:
         conn = get_db_connection()
@@ -510,9 +846,9 @@ def get_zones():
                 MAX(location_lat) as lat,
                 MAX(location_lon) as lon
             FROM iot_sensors
-            WHERE timestamp >= datetime('now', '-1 hour')
+            WHERE ts >= ?
             GROUP BY location_name
-        ''')
+        ''', (since_epoch(1),))
         
         zones_data = cursor.fetchall()
         conn.close()
@@ -560,174 +896,275 @@ def get_zones():
         print(f"Erreur zones: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
-@app.route('/api/report/generate', methods=['POST'])
+@app.route('/api/raw/<table>/<int:row_id>', methods=['GET'])
 @require_auth
-def generate_report():
+def get_raw_payload(table, row_id):
+    """Réponse brute de l'API externe à l'origine d'une mesure (chargée à la demande)"""
+    if table not in raw_payloads.RAW_TABLES:
+        return jsonify({"success": False, "message": f"Table inconnue: {table}"}), 404
+    
+    conn = get_db_connection()
     try:
-        data = request.get_json()
-        period = data.get('period', 'quotidien')
-        format_type = data.get('format', 'resume')
-        zone = data.get('zone', 'toutes')
-        
-        buffer = BytesIO()
-        p = canvas.Canvas(buffer, pagesize=letter)
-        width, height = letter
-        
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT raw_id FROM {table} WHERE id = ?', (row_id,))
+        row = cursor.fetchone()
+        payload = raw_payloads.load(cursor, row['raw_id']) if row and row['raw_id'] is not None else None
+    finally:
+        conn.close()
+    
+    if payload is None:
+        return jsonify({"success": False, "message": "Reponse brute introuvable"}), 404
+    response = app.response_class(payload, mimetype='application/json')
+    # Contenu immuable : une mesure ne change jamais de réponse brute
+    response.cache_control.private = True
+    response.cache_control.max_age = 86400
+    return response
+
+@app.route('/api/export', methods=['GET'])
+@require_auth
+def export_data():
+    table = request.args.get('table', 'air_quality')
+    format_type = request.args.get('format', 'ndjson')
+    requested = [c for c in request.args.get('columns', '').split(',') if c]
+    
+    try:
+        if format_type not in EXPORT_FORMATS:
+            raise ValueError(f"Format inconnu: {format_type}")
+        end = parse_epoch(request.args.get('end')) or int(time.time()) + 1
+        start = parse_epoch(request.args.get('start'))
+        if start is None:
+            start = end - 24 * 3600
         conn = get_db_connection()
+        try:
+            columns = export_columns(conn, table, requested)
+        finally:
+            conn.close()
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    
+    response = Response(
+        stream_with_context(export_stream(DB_NAME, table, columns, start, end, format_type)),
+        mimetype=EXPORT_FORMATS[format_type]
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename="{table}_{start}_{end}.{format_type}"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+REPORT_PERIOD_HOURS = {'quotidien': 24, 'hebdomadaire': 168, 'mensuel': 720}
+
+def report_bucket(period):
+    """Seau courant de la période, au pas du niveau d'agrégat lu par le rapport :
+    même seau -> même rapport (réutilisé par tous les processus)"""
+    _, size = rollups.choose_level(REPORT_PERIOD_HOURS.get(period, 24) * 3600)
+    return int(time.time()) // size
+
+def build_report_pdf(period='quotidien', format_type='resume', zone='toutes'):
+    """Rendu PDF du rapport (exécuté par les workers de report_jobs)"""
+    buffer = BytesIO()
+    p = canvas.Canvas(buffer, pagesize=letter)
+    width, height = letter
+    
+    conn = get_db_connection()
+    try:
         cursor = conn.cursor()
         
-        hours_map = {'quotidien': 24, 'hebdomadaire': 168, 'mensuel': 720}
-        hours = hours_map.get(period, 24)
+        hours = REPORT_PERIOD_HOURS.get(period, 24)
         
-        cursor.execute(f'''
-            SELECT 
-                AVG(aqi) as avg_aqi, 
-                AVG(pm25) as avg_pm25, 
-                AVG(pm10) as avg_pm10,
-                AVG(no2) as avg_no2,
-                AVG(o3) as avg_o3,
-                MAX(aqi) as max_aqi,
-                MIN(aqi) as min_aqi,
-                COUNT(*) as count
-            FROM air_quality
-            WHERE timestamp >= datetime('now', '-{hours} hours')
-        ''')
-        stats = dict_from_row(cursor.fetchone())
+        aggregates = rollups.aggregate(cursor, 'city', since_epoch(hours), int(time.time()) + 1,
+                                       ('aqi', 'pm25', 'pm10', 'no2', 'o3'))
+        stats = {f'avg_{name}': values['avg'] for name, values in aggregates.items()}
+        stats['max_aqi'] = aggregates['aqi']['max']
+        stats['min_aqi'] = aggregates['aqi']['min']
+        stats['count'] = aggregates['aqi']['count']
         
-        cursor.execute(f'''
+        cursor.execute('''
             SELECT COUNT(*) as count
             FROM alerts
-            WHERE timestamp >= datetime('now', '-{hours} hours')
-            AND status = 'active'
-        ''')
+            WHERE status = 'active'
+            AND ts >= ?
+        ''', (since_epoch(hours),))
         alert_count = cursor.fetchone()['count']
         
         predictions_summary = None
         if format_type == 'detaille':
-            predictions_file = 'predictions_24h.json'
-            if os.path.exists(predictions_file):
-                with open(predictions_file, 'r', encoding='utf-8') as f:
-                    predictions = json.load(f)
-                    if len(predictions) > 0:
-                        predictions_summary = {
-                            'count': len(predictions),
-                            'avg_aqi': sum(p['aqi'] for p in predictions) / len(predictions),
-                            'max_aqi': max(p['aqi'] for p in predictions),
-                            'min_aqi': min(p['aqi'] for p in predictions)
-                        }
-        
+            snapshot = predictions_provider.get()
+            if snapshot.from_file:
+                predictions_summary = snapshot.summary
+    finally:
         conn.close()
-        
-        p.setFont("Helvetica-Bold", 24)
-        p.drawString(inch, height - inch, f"Rapport Smart City")
-        
-        p.setFont("Helvetica", 14)
-        p.drawString(inch, height - 1.4*inch, f"Période: {period.capitalize()}")
-        p.drawString(inch, height - 1.7*inch, f"Zone: {zone.capitalize()}")
-        p.drawString(inch, height - 2.0*inch, f"Type: {format_type.capitalize()}")
-        p.drawString(inch, height - 2.3*inch, f"Généré le: {datetime.now().strftime('%d/%m/%Y à %H:%M')}")
-        
-        y = height - 3*inch
+    
+    p.setFont("Helvetica-Bold", 24)
+    p.drawString(inch, height - inch, f"Rapport Smart City")
+    
+    p.setFont("Helvetica", 14)
+    p.drawString(inch, height - 1.4*inch, f"Période: {period.capitalize()}")
+    p.drawString(inch, height - 1.7*inch, f"Zone: {zone.capitalize()}")
+    p.drawString(inch, height - 2.0*inch, f"Type: {format_type.capitalize()}")
+    p.drawString(inch, height - 2.3*inch, f"Généré le: {datetime.now().strftime('%d/%m/%Y à %H:%M')}")
+    
+    y = height - 3*inch
+    p.setFont("Helvetica-Bold", 16)
+    p.drawString(inch, y, "📊 Statistiques de la qualité de l'air")
+    
+    y -= 0.5*inch
+    p.setFont("Helvetica", 12)
+    
+    stats_data = [
+        (f"AQI Moyen:", f"{stats['avg_aqi']:.1f}"),
+        (f"AQI Maximum:", f"{stats['max_aqi']:.1f}"),
+        (f"AQI Minimum:", f"{stats['min_aqi']:.1f}"),
+        (f"PM2.5 Moyen:", f"{stats['avg_pm25']:.1f} µg/m³"),
+        (f"PM10 Moyen:", f"{stats['avg_pm10']:.1f} µg/m³"),
+        (f"NO2 Moyen:", f"{stats['avg_no2']:.1f} µg/m³"),
+        (f"O3 Moyen:", f"{stats['avg_o3']:.1f} µg/m³"),
+        (f"Mesures collectées:", f"{stats['count']}")
+    ]
+    
+    for label, value in stats_data:
+        p.drawString(inch, y, label)
+        p.drawString(inch + 2.5*inch, y, value)
+        y -= 0.25*inch
+    
+    y -= 0.3*inch
+    p.setFont("Helvetica-Bold", 16)
+    p.drawString(inch, y, "🚨 Alertes générées")
+    
+    y -= 0.4*inch
+    p.setFont("Helvetica", 12)
+    p.drawString(inch, y, f"Nombre total d'alertes: {alert_count}")
+    
+    if format_type == 'detaille' and predictions_summary:
+        y -= 0.5*inch
         p.setFont("Helvetica-Bold", 16)
-        p.drawString(inch, y, "📊 Statistiques de la qualité de l'air")
+        p.drawString(inch, y, "🔮 Prédictions IA (24h)")
         
-        y -= 0.5*inch
+        y -= 0.4*inch
         p.setFont("Helvetica", 12)
         
-        stats_data = [
-            (f"AQI Moyen:", f"{stats['avg_aqi']:.1f}"),
-            (f"AQI Maximum:", f"{stats['max_aqi']:.1f}"),
-            (f"AQI Minimum:", f"{stats['min_aqi']:.1f}"),
-            (f"PM2.5 Moyen:", f"{stats['avg_pm25']:.1f} µg/m³"),
-            (f"PM10 Moyen:", f"{stats['avg_pm10']:.1f} µg/m³"),
-            (f"NO2 Moyen:", f"{stats['avg_no2']:.1f} µg/m³"),
-            (f"O3 Moyen:", f"{stats['avg_o3']:.1f} µg/m³"),
-            (f"Mesures collectées:", f"{stats['count']}")
+        pred_data = [
+            (f"Nombre de prédictions:", f"{predictions_summary['count']}"),
+            (f"AQI moyen prédit:", f"{predictions_summary['avg_aqi']:.1f}"),
+            (f"AQI max prédit:", f"{predictions_summary['max_aqi']}"),
+            (f"AQI min prédit:", f"{predictions_summary['min_aqi']}"),
         ]
         
-        for label, value in stats_data:
+        for label, value in pred_data:
             p.drawString(inch, y, label)
             p.drawString(inch + 2.5*inch, y, value)
             y -= 0.25*inch
-        
-        y -= 0.3*inch
-        p.setFont("Helvetica-Bold", 16)
-        p.drawString(inch, y, "🚨 Alertes générées")
-        
-        y -= 0.4*inch
-        p.setFont("Helvetica", 12)
-        p.drawString(inch, y, f"Nombre total d'alertes: {alert_count}")
-        
-        if format_type == 'detaille' and predictions_summary:
-            y -= 0.5*inch
-            p.setFont("Helvetica-Bold", 16)
-            p.drawString(inch, y, "🔮 Prédictions IA (24h)")
-            
-            y -= 0.4*inch
-            p.setFont("Helvetica", 12)
-            
-            pred_data = [
-                (f"Nombre de prédictions:", f"{predictions_summary['count']}"),
-                (f"AQI moyen prédit:", f"{predictions_summary['avg_aqi']:.1f}"),
-                (f"AQI max prédit:", f"{predictions_summary['max_aqi']}"),
-                (f"AQI min prédit:", f"{predictions_summary['min_aqi']}"),
-            ]
-            
-            for label, value in pred_data:
-                p.drawString(inch, y, label)
-                p.drawString(inch + 2.5*inch, y, value)
-                y -= 0.25*inch
-        
-        y -= 0.5*inch
-        if y < 2*inch:
+    
+    y -= 0.5*inch
+    if y < 2*inch:
+        p.showPage()
+        y = height - inch
+    
+    p.setFont("Helvetica-Bold", 16)
+    p.drawString(inch, y, "💡 Recommandations")
+    
+    y -= 0.4*inch
+    p.setFont("Helvetica", 11)
+    
+    recommendations = [
+        "• Surveiller particulièrement la Zone Industrielle",
+        "• Renforcer la surveillance aux heures de pointe (7-9h, 17-19h)",
+        "• Maintenir la collecte de données en continu",
+        "• Informer la population en cas de pics de pollution"
+    ]
+    
+    for rec in recommendations:
+        if y < inch:
             p.showPage()
             y = height - inch
+        p.drawString(inch, y, rec)
+        y -= 0.25*inch
+    
+    p.setFont("Helvetica-Oblique", 9)
+    p.drawString(inch, 0.5*inch, f"Smart City Platform - Rapport {format_type} - {datetime.now().strftime('%d/%m/%Y %H:%M')}")
+    
+    p.showPage()
+    p.save()
+    
+    return buffer.getvalue()
+
+report_jobs = ReportJobs(build_report_pdf)
+
+def report_download_name(job):
+    params = job['params'] or {}
+    generated = datetime.fromtimestamp(job['finished_at'] or time.time())
+    return (f"rapport_smartcity_{params.get('format_type', 'rapport')}_{params.get('period', '')}_"
+            f"{generated.strftime('%Y%m%d_%H%M')}.pdf")
+
+def report_job_response(job):
+    return {
+        "success": True,
+        "job_id": job['id'],
+        "status": job['status'],
+        "error": job['error'],
+        "status_url": f"/api/report/jobs/{job['id']}",
+        "download_url": f"/api/report/jobs/{job['id']}/download"
+    }
+
+def send_report(job):
+    """PDF d'une tâche terminée ; 410 s'il vient d'être évincé du cache (à relancer)"""
+    try:
+        return send_file(report_jobs.path(job['id']), mimetype='application/pdf',
+                         as_attachment=True, download_name=report_download_name(job))
+    except FileNotFoundError:
+        return jsonify({"success": False, "message": "Rapport expiré, relancer la génération"}), 410
+
+@app.route('/api/report/generate', methods=['POST'])
+@require_auth
+def generate_report():
+    try:
+        data = request.get_json() or {}
+        params = {
+            'period': data.get('period', 'quotidien'),
+            'format_type': data.get('format', 'resume'),
+            'zone': data.get('zone', 'toutes')
+        }
         
-        p.setFont("Helvetica-Bold", 16)
-        p.drawString(inch, y, "💡 Recommandations")
-        
-        y -= 0.4*inch
-        p.setFont("Helvetica", 11)
-        
-        recommendations = [
-            "• Surveiller particulièrement la Zone Industrielle",
-            "• Renforcer la surveillance aux heures de pointe (7-9h, 17-19h)",
-            "• Maintenir la collecte de données en continu",
-            "• Informer la population en cas de pics de pollution"
-        ]
-        
-        for rec in recommendations:
-            if y < inch:
-                p.showPage()
-                y = height - inch
-            p.drawString(inch, y, rec)
-            y -= 0.25*inch
+        job = report_jobs.submit(params, report_bucket(params['period']))
         
-        p.setFont("Helvetica-Oblique", 9)
-        p.drawString(inch, 0.5*inch, f"Smart City Platform - Rapport {format_type} - {datetime.now().strftime('%d/%m/%Y %H:%M')}")
+        # Compatibilité : "async": false attend le rendu et renvoie directement le PDF
+        if data.get('async', True) is False:
+            job = report_jobs.wait(job['id'])
+            if job['status'] != STATUS_DONE:
+                return jsonify(report_job_response(job)), 500
+            return send_report(job)
         
-        p.showPage()
-        p.save()
-        
-        buffer.seek(0)
-        return send_file(
-            buffer,
-            mimetype='application/pdf',
-            as_attachment=True,
-            download_name=f'rapport_smartcity_{format_type}_{period}_{datetime.now().strftime("%Y%m%d_%H%M")}.pdf'
-        )
+        return jsonify(report_job_response(job)), 202
         
     except Exception as e:
         print(f"Erreur génération rapport: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/api/report/jobs/<job_id>', methods=['GET'])
+@require_auth
+def get_report_job(job_id):
+    job = report_jobs.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": "Tâche introuvable"}), 404
+    return jsonify(report_job_response(job))
+
+@app.route('/api/report/jobs/<job_id>/download', methods=['GET'])
+@require_auth
+def download_report(job_id):
+    job = report_jobs.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": "Tâche introuvable"}), 404
+    if job['status'] != STATUS_DONE:
+        return jsonify(report_job_response(job)), 409
+    return send_report(job)
+
 if __name__ == '__main__':
     print("\n" + "=" * 70)
     print("API BACKEND SMART CITY - DEMARRAGE")
     print("=" * 70)
 
     init_database()
+    start_sweeper(get_db_connection)
 
+    print("Mode developpement (serveur Werkzeug) - production : voir wsgi.py / ./start.sh --prod")
     print(f"API disponible sur : http://localhost:5173")
     print(f"Login de test : admin@smartcity.com / admin123")
     print(f"Login de test : marie.dubois@smartcity.com / password123")
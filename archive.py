@@ -0,0 +1,193 @@
+"""
+Archive colonnaire - Smart City
+Export Parquet partitionné par jour et par table (polluants en float32)
+et lecture directe en NumPy / pandas, sans toucher à la base SQLite en service
+
+Dépendance optionnelle : pyarrow (pip install pyarrow)
+
+Usage : python archive.py [--days 30] [--force]
+"""
+
+import argparse
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import db_pool
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# ========================================
+# CONFIGURATION
+# ========================================
+DB_NAME = "smartcity.db"
+ARCHIVE_DIR = "archive"
+ARCHIVE_TABLES = ('air_quality', 'weather', 'iot_sensors', 'alerts')
+# Colonnes redondantes (ts), volumineuses ou pointant vers raw_payloads, non archivées
+SKIPPED_COLUMNS = {'timestamp', 'raw_data', 'raw_id'}
+BATCH_SIZE = 50000
+COMPRESSION = 'zstd'
+
+DAY_SECONDS = 86400
+
+def require_pyarrow():
+    if pa is None:
+        raise RuntimeError("pyarrow est requis pour l'archive colonnaire (pip install pyarrow)")
+
+# ========================================
+# SCHÉMA
+# ========================================
+
+def arrow_schema(conn, table):
+    """Schéma Arrow dérivé du schéma SQLite : REAL -> float32, INTEGER -> int64"""
+    fields = []
+    for _, name, declared, *_ in conn.execute(f'PRAGMA table_info({table})').fetchall():
+        if name in SKIPPED_COLUMNS:
+            continue
+        declared = (declared or '').upper()
+        if 'INT' in declared:
+            arrow_type = pa.int64()
+        elif 'REAL' in declared:
+            arrow_type = pa.float32()
+        else:
+            arrow_type = pa.dictionary(pa.int32(), pa.string())
+        fields.append(pa.field(name, arrow_type))
+    return pa.schema(fields)
+
+def _select_column(field):
+    """Expression SQL d'une colonne : valeur non numérique d'une colonne typée
+    (ex. "aqi": "-" renvoyé par WAQI) archivée comme nulle"""
+    name = field.name
+    if pa.types.is_integer(field.type):
+        return f"CASE WHEN typeof({name}) IN ('integer', 'real') THEN CAST({name} AS INTEGER) END AS {name}"
+    if pa.types.is_floating(field.type):
+        return f"CASE WHEN typeof({name}) IN ('integer', 'real') THEN {name} END AS {name}"
+    return name
+
+def partition_path(table, day, archive_dir=ARCHIVE_DIR):
+    return os.path.join(archive_dir, table, f"{table}_{day.isoformat()}.parquet")
+
+# ========================================
+# ÉCRITURE
+# ========================================
+
+def archive_day(conn, table, day, archive_dir=ARCHIVE_DIR):
+    """Écrire la partition d'un jour UTC ; renvoie le nombre de lignes"""
+    require_pyarrow()
+    schema = arrow_schema(conn, table)
+    start = int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp())
+
+    cursor = conn.cursor()
+    cursor.arraysize = BATCH_SIZE
+    cursor.execute(f'''
+        SELECT {', '.join(_select_column(field) for field in schema)} FROM {table}
+        WHERE {table}.ts >= ? AND {table}.ts < ?
+        ORDER BY {table}.ts ASC
+    ''', (start, start + DAY_SECONDS))
+
+    path = partition_path(table, day, archive_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    count = 0
+    writer = pq.ParquetWriter(tmp_path, schema, compression=COMPRESSION)
+    try:
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                break
+            columns = list(zip(*rows))
+            arrays = [pa.array(values, type=field.type.value_type).dictionary_encode()
+                      if pa.types.is_dictionary(field.type) else pa.array(values, type=field.type)
+                      for field, values in zip(schema, columns)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            count += len(rows)
+    except BaseException:
+        writer.close()
+        os.remove(tmp_path)
+        raise
+    writer.close()
+
+    # Remplacement atomique : un lecteur ne voit jamais de partition à moitié écrite
+    os.replace(tmp_path, path)
+    return count
+
+def archive_range(days=30, force=False, db_name=DB_NAME, archive_dir=ARCHIVE_DIR):
+    """Archiver les jours complets (hier et avant) non encore archivés"""
+    require_pyarrow()
+    today = datetime.now(timezone.utc).date()
+    conn = db_pool.connect(db_name)
+    try:
+        for offset in range(days, 0, -1):
+            day = today - timedelta(days=offset)
+            for table in ARCHIVE_TABLES:
+                if not force and os.path.exists(partition_path(table, day, archive_dir)):
+                    continue
+                started = time.time()
+                count = archive_day(conn, table, day, archive_dir)
+                print(f"  {table} {day}: {count} lignes ({time.time() - started:.1f}s)")
+    finally:
+        conn.close()
+
+# ========================================
+# LECTURE
+# ========================================
+
+def partitions(table, start_day, end_day, archive_dir=ARCHIVE_DIR):
+    day = start_day
+    paths = []
+    while day <= end_day:
+        path = partition_path(table, day, archive_dir)
+        if os.path.exists(path):
+            paths.append(path)
+        day += timedelta(days=1)
+    return paths
+
+def count_rows(table, start_day, end_day, archive_dir=ARCHIVE_DIR):
+    """Nombre de lignes archivées, lu dans les métadonnées Parquet (aucune donnée chargée)"""
+    require_pyarrow()
+    return sum(pq.ParquetFile(path).metadata.num_rows
+               for path in partitions(table, start_day, end_day, archive_dir))
+
+def load_table(table, start_day, end_day, columns=None, archive_dir=ARCHIVE_DIR):
+    """Table Arrow des partitions [start_day, end_day] (None si rien d'archivé)"""
+    require_pyarrow()
+    paths = partitions(table, start_day, end_day, archive_dir)
+    if not paths:
+        return None
+    tables = [pq.read_table(path, columns=columns, memory_map=True) for path in paths]
+    return pa.concat_tables(tables, promote_options='default').combine_chunks()
+
+def load_columns(table, start_day, end_day, columns, archive_dir=ARCHIVE_DIR):
+    """{colonne: ndarray} ; sans copie pour les colonnes numériques sans valeur nulle"""
+    data = load_table(table, start_day, end_day, columns, archive_dir)
+    if data is None:
+        return {column: None for column in columns}
+    return {name: data.column(name).chunk(0).to_numpy(zero_copy_only=False)
+            if data.column(name).num_chunks else None
+            for name in columns}
+
+def load_dataframe(table, start_day, end_day, columns=None, archive_dir=ARCHIVE_DIR):
+    """DataFrame pandas des partitions, conversion en blocs séparés (copies minimales)"""
+    data = load_table(table, start_day, end_day, columns, archive_dir)
+    if data is None:
+        return None
+    return data.to_pandas(split_blocks=True, self_destruct=True)
+
+# ========================================
+# PROGRAMME PRINCIPAL
+# ========================================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive Parquet des series temporelles")
+    parser.add_argument('--days', type=int, default=30, help="nombre de jours passes a archiver")
+    parser.add_argument('--force', action='store_true', help="reecrire les partitions existantes")
+    args = parser.parse_args()
+
+    print(f"Archivage des {args.days} derniers jours dans {ARCHIVE_DIR}/ ...")
+    archive_range(args.days, args.force)
+    print("Archivage termine")
@@ -0,0 +1,9 @@
+"""
+Bancs d'essai - Smart City
+generate_data : base synthétique au schéma réel (init_database) de 1M à 100M lignes
+load_test     : charge concurrente sur les endpoints, percentiles et comparaison à une référence
+
+Usage (depuis la racine du backend) :
+    python -m benchmarks.generate_data --rows 1000000
+    python -m benchmarks.load_test --db benchmarks/bench_smartcity.db --save-baseline benchmarks/baseline.json
+"""
@@ -0,0 +1,236 @@
+"""
+Générateur de données synthétiques - Smart City
+Base au schéma réel (api_backend.init_database + migrations), lignes réparties
+sur les quatre séries temporelles, horodatées régulièrement jusqu'à maintenant
+
+Usage : python -m benchmarks.generate_data --rows 10000000 [--days 30] [--stations 1] [--db ...] [--force]
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+
+import api_backend
+import db_pool
+import latest_snapshot
+import raw_payloads
+import rollups
+import stations
+
+# ========================================
+# CONFIGURATION
+# ========================================
+DEFAULT_DB = os.path.join('benchmarks', 'bench_smartcity.db')
+BATCH_SIZE = 50000
+
+# Part des lignes par table (ordre de grandeur du collecteur : 3 capteurs IoT par cycle)
+TABLE_SHARES = {
+    'iot_sensors': 0.60,
+    'air_quality': 0.20,
+    'weather': 0.15,
+    'alerts': 0.05,
+}
+
+SENSORS = [
+    ("SENSOR_01", "Centre-ville", 48.8566, 2.3522),
+    ("SENSOR_02", "Nord Paris", 48.8606, 2.3376),
+    ("SENSOR_03", "Est Paris", 48.8449, 2.3735)
+]
+ALERT_TYPES = ['PM2.5', 'PM10', "NO2 (Dioxyde d'azote)", 'O3 (Ozone)', 'Prédiction']
+ALERT_ZONES = ['Zone Industrielle', 'Centre-ville', 'Résidentiel Nord']
+ALERT_LEVELS = ['Modéré', 'Important', 'Alerte']
+WEATHER_STATES = [('Clear', 'ciel dégagé'), ('Clouds', 'nuageux'), ('Rain', 'pluie modérée')]
+# Villes des stations synthétiques (--stations > 1), réparties à tour de rôle
+STATION_CITIES = [('paris', 48.8566, 2.3522), ('lyon', 45.7640, 4.8357),
+                  ('marseille', 43.2965, 5.3698), ('lille', 50.6292, 3.0573)]
+
+# ========================================
+# LIGNES
+# ========================================
+
+def synthetic_stations(count):
+    """count stations réparties sur STATION_CITIES (1 : la station historique de Paris)"""
+    if count <= 1:
+        return [stations.LEGACY_STATION]
+    result = []
+    for i in range(count):
+        city, lat, lon = STATION_CITIES[i % len(STATION_CITIES)]
+        result.append(stations.normalize({
+            'id': f'{city}-{i:03d}', 'city': city, 'name': f'{city.title()} {i:03d}',
+            'lat': round(lat + (i // len(STATION_CITIES)) * 0.001, 4), 'lon': lon}))
+    return result
+
+def _timestamps(count, start, end):
+    step = (end - start) / max(count, 1)
+    for i in range(count):
+        ts = int(start + i * step)
+        yield ts, time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ts))
+
+def air_quality_rows(rng, count, start, end, station_list):
+    for i, (ts, timestamp) in enumerate(_timestamps(count, start, end)):
+        station = station_list[i % len(station_list)]
+        pm25 = round(rng.uniform(5, 75), 1)
+        values = {
+            'pm25': pm25, 'pm10': round(pm25 * rng.uniform(1.3, 1.8), 1),
+            'no2': round(rng.uniform(10, 60), 1), 'o3': round(rng.uniform(20, 150), 1),
+            'so2': round(rng.uniform(1, 20), 1), 'co': round(rng.uniform(1, 10), 1),
+            'nh3': None
+        }
+        aqi = int(pm25 * 2)
+        raw = json.dumps({'status': 'ok', 'data': {
+            'aqi': aqi, 'city': {'name': station['name']}, 'time': {'v': ts},
+            'iaqi': {name: {'v': value} for name, value in values.items() if value is not None}}})
+        yield (timestamp, ts, station['id'], station['name'], aqi, values['pm25'], values['pm10'],
+               values['no2'], values['o3'], values['so2'], values['co'], values['nh3'], station['name'], raw)
+
+def weather_rows(rng, count, start, end, station_list):
+    for i, (ts, timestamp) in enumerate(_timestamps(count, start, end)):
+        station = station_list[i % len(station_list)]
+        temperature = round(rng.uniform(-2, 32), 1)
+        main, description = rng.choice(WEATHER_STATES)
+        humidity = rng.randint(30, 95)
+        pressure = rng.randint(990, 1035)
+        wind_speed = round(rng.uniform(0, 12), 1)
+        raw = json.dumps({'name': station['name'], 'dt': ts,
+                          'main': {'temp': temperature, 'humidity': humidity, 'pressure': pressure},
+                          'wind': {'speed': wind_speed},
+                          'weather': [{'main': main, 'description': description}]})
+        yield (timestamp, ts, station['id'], station['name'], temperature, temperature - 1, temperature - 2, temperature + 2,
+               humidity, pressure, wind_speed, rng.randint(0, 359), rng.randint(0, 100),
+               10000, main, description, raw)
+
+def iot_rows(rng, count, start, end, station_list):
+    for i, (ts, timestamp) in enumerate(_timestamps(count, start, end)):
+        sensor_id, location, lat, lon = SENSORS[i % len(SENSORS)]
+        pm25 = round(rng.uniform(5, 75), 1)
+        yield (timestamp, ts, sensor_id, location, lat, lon, pm25,
+               round(pm25 * rng.uniform(1.3, 1.8), 1), round(rng.uniform(10, 60), 1),
+               round(rng.uniform(20, 150), 1), round(rng.uniform(5, 140), 1),
+               round(rng.uniform(100, 15000), 1), round(rng.uniform(10, 28), 1),
+               round(rng.uniform(35, 85), 1))
+
+def alert_rows(rng, count, start, end, station_list):
+    for ts, timestamp in _timestamps(count, start, end):
+        value = round(rng.uniform(40, 200), 1)
+        alert_type = rng.choice(ALERT_TYPES)
+        station_id = None if alert_type == 'Prédiction' else rng.choice(station_list)['id']
+        yield (timestamp, ts, alert_type, rng.choice(ALERT_ZONES),
+               rng.choice(ALERT_LEVELS), f"Niveau élevé: {value}µg/m³", value, 50.0,
+               rng.choice([12000, 15000, 25000]), 'active' if rng.random() < 0.2 else 'resolved', station_id)
+
+TABLES = {
+    'air_quality': (air_quality_rows, '''
+        INSERT INTO air_quality
+        (timestamp, ts, station_id, city, aqi, pm25, pm10, no2, o3, so2, co, nh3, station_name, raw_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''),
+    'weather': (weather_rows, '''
+        INSERT INTO weather
+        (timestamp, ts, station_id, city, temperature, feels_like, temp_min, temp_max, humidity,
+         pressure, wind_speed, wind_direction, clouds, visibility,
+         weather_main, weather_description, raw_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''),
+    'iot_sensors': (iot_rows, '''
+        INSERT INTO iot_sensors
+        (timestamp, ts, sensor_id, location_name, location_lat, location_lon,
+         pm25, pm10, no2, o3, so2, co, temperature, humidity)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''),
+    'alerts': (alert_rows, '''
+        INSERT INTO alerts (timestamp, ts, type, zone, level, message, value, threshold, population, status,
+                            station_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''),
+}
+
+# ========================================
+# GÉNÉRATION
+# ========================================
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def generate(db_name=DEFAULT_DB, total_rows=1000000, days=30, seed=42, force=False, station_count=1):
+    if os.path.exists(db_name):
+        if not force:
+            raise SystemExit(f"{db_name} existe deja (--force pour le remplacer)")
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_name + suffix):
+                os.remove(db_name + suffix)
+    os.makedirs(os.path.dirname(db_name) or '.', exist_ok=True)
+
+    # Schéma réel : mêmes tables, index, triggers et migrations que l'API
+    api_backend.DB_NAME = db_name
+    api_backend.init_database()
+    # Le chargement en masse n'a pas à passer par le journal des requêtes lentes
+    db_pool.query_observers.clear()
+
+    rng = random.Random(seed)
+    end = int(time.time())
+    start = end - days * 86400
+    conn = db_pool.connect(db_name)
+    cursor = conn.cursor()
+    cursor.execute('PRAGMA synchronous = OFF')
+    station_list = synthetic_stations(station_count)
+    stations.sync(cursor, station_list)
+
+    # Triggers ligne à ligne inutiles pour un chargement en masse : reconstruits à la fin
+    for source in latest_snapshot.SOURCES:
+        cursor.execute(f'DROP TRIGGER IF EXISTS trg_{source}_latest')
+    conn.commit()
+
+    try:
+        for table, share in TABLE_SHARES.items():
+            make_rows, sql = TABLES[table]
+            count = int(total_rows * share)
+            started = time.time()
+            for batch in _batches(make_rows(rng, count, start, end, station_list), BATCH_SIZE):
+                if table in raw_payloads.RAW_TABLES:
+                    # Dernière valeur : réponse brute, remplacée par son id dans raw_payloads
+                    batch = [row[:-1] + (raw_payloads.store(cursor, row[-1]),) for row in batch]
+                cursor.executemany(sql, batch)
+                conn.commit()
+            print(f"  {table}: {count} lignes ({time.time() - started:.1f}s)")
+
+        started = time.time()
+        cursor.execute('BEGIN')
+        latest_snapshot.rebuild(cursor)
+        latest_snapshot.install_triggers(cursor)
+        rollups.rebuild(cursor)
+        db_pool.bump_data_version(cursor)
+        conn.commit()
+        print(f"  agregats et dernieres mesures ({time.time() - started:.1f}s)")
+
+        cursor.execute('ANALYZE')
+    finally:
+        conn.close()
+        db_pool.close_pools()
+
+# ========================================
+# PROGRAMME PRINCIPAL
+# ========================================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Base SQLite synthetique pour les bancs d'essai")
+    parser.add_argument('--rows', type=int, default=1000000, help="nombre total de lignes (toutes tables)")
+    parser.add_argument('--days', type=int, default=30, help="profondeur d'historique en jours")
+    parser.add_argument('--db', default=DEFAULT_DB, help="fichier de base a creer")
+    parser.add_argument('--stations', type=int, default=1, help="nombre de stations (reparties sur 4 villes)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--force', action='store_true', help="remplacer une base existante")
+    args = parser.parse_args()
+
+    print(f"Generation de {args.rows} lignes sur {args.days} jours dans {args.db} ...")
+    started = time.time()
+    generate(args.db, args.rows, args.days, args.seed, args.force, args.stations)
+    print(f"Base generee en {time.time() - started:.1f}s ({os.path.getsize(args.db) / 1e6:.0f} Mo)")
@@ -0,0 +1,245 @@
+"""
+Banc de charge des endpoints - Smart City
+Requêtes concurrentes par endpoint (client de test Flask ou serveur HTTP),
+latences p50 / p95 / p99, débit, et comparaison à une référence JSON
+
+Usage :
+    python -m benchmarks.load_test --db benchmarks/bench_smartcity.db [--concurrency 8] [--duration 10]
+    python -m benchmarks.load_test --url http://localhost:5173
+    ... --save-baseline benchmarks/baseline.json   (enregistrer la référence)
+    ... --baseline benchmarks/baseline.json        (comparer ; code retour 1 si régression)
+"""
+
+import argparse
+import json
+import math
+import platform
+import sys
+import threading
+import time
+
+# ========================================
+# CONFIGURATION
+# ========================================
+ENDPOINTS = {
+    'dashboard': ('GET', '/api/dashboard?period=24h', None),
+    'dashboard_city': ('GET', '/api/dashboard?period=24h&city=paris', None),
+    'statistics': ('GET', '/api/statistics?period=7d', None),
+    'zones': ('GET', '/api/zones', None),
+    'alerts': ('GET', '/api/alerts?limit=50', None),
+    # Mise en file seulement (202, tâche ou PDF déjà en cache) : le rendu n'est pas chronométré
+    'report_enqueue': ('POST', '/api/report/generate', {'period': 'quotidien', 'format': 'resume'}),
+}
+
+LOGIN = {'email': 'admin@smartcity.com', 'password': 'admin123'}
+# Dégradation tolérée de p95 / débit avant de signaler une régression
+DEFAULT_TOLERANCE = 0.20
+
+# ========================================
+# CLIENTS
+# ========================================
+
+class FlaskClient:
+    """Appels en processus via le client de test Flask (sans réseau)"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+        self.headers = {}
+
+    def request(self, method, path, body=None):
+        response = self.client.open(path, method=method, json=body, headers=self.headers)
+        response.get_data()
+        return response.status_code
+
+    def login(self):
+        return self.client.post('/api/auth/login', json=LOGIN).get_json()['token']
+
+    def authorize(self, token):
+        self.headers = {'Authorization': f'Bearer {token}'}
+
+
+class HttpClient:
+    """Appels vers un serveur lancé (python api_backend.py ou gunicorn)"""
+
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+
+    def request(self, method, path, body=None):
+        response = self.session.request(method, self.base_url + path, json=body, timeout=120)
+        response.content
+        return response.status_code
+
+    def login(self):
+        response = self.session.post(self.base_url + '/api/auth/login', json=LOGIN, timeout=30)
+        return response.json()['token']
+
+    def authorize(self, token):
+        self.session.headers['Authorization'] = f'Bearer {token}'
+
+# ========================================
+# MESURES
+# ========================================
+
+def percentile(sorted_values, fraction):
+    """Percentile au rang le plus proche sur une liste triée"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+def run_endpoint(make_client, token, name, concurrency, duration, max_requests):
+    method, path, body = ENDPOINTS[name]
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    remaining = [max_requests]
+
+    def worker():
+        client = make_client()
+        client.authorize(token)
+        local, failed = [], 0
+        while time.perf_counter() < deadline:
+            with lock:
+                if remaining[0] is not None:
+                    if remaining[0] <= 0:
+                        break
+                    remaining[0] -= 1
+            started = time.perf_counter()
+            try:
+                status = client.request(method, path, body)
+            except Exception:
+                status = None
+            local.append(time.perf_counter() - started)
+            if status is None or status >= 400:
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'throughput': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+        'p50_ms': _ms(percentile(latencies, 0.50)),
+        'p95_ms': _ms(percentile(latencies, 0.95)),
+        'p99_ms': _ms(percentile(latencies, 0.99)),
+        'max_ms': _ms(latencies[-1] if latencies else None),
+    }
+
+def _ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+# ========================================
+# RÉFÉRENCE
+# ========================================
+
+def compare(results, baseline, tolerance):
+    """Lignes de comparaison et liste des endpoints en régression"""
+    lines, regressions = [], []
+    for name, current in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous or not previous.get('p95_ms') or not current.get('p95_ms'):
+            continue
+        p95_change = current['p95_ms'] / previous['p95_ms'] - 1
+        throughput_change = (current['throughput'] / previous['throughput'] - 1
+                             if previous.get('throughput') else 0)
+        regressed = p95_change > tolerance or throughput_change < -tolerance
+        if regressed:
+            regressions.append(name)
+        lines.append(f"  {name:<15} p95 {previous['p95_ms']:>9.2f} -> {current['p95_ms']:>9.2f} ms "
+                     f"({p95_change:+.0%})  debit {throughput_change:+.0%}"
+                     f"{'  REGRESSION' if regressed else ''}")
+    return lines, regressions
+
+# ========================================
+# PROGRAMME PRINCIPAL
+# ========================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banc de charge des endpoints de l'API")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--db', help="base a utiliser avec le client de test Flask (en processus)")
+    target.add_argument('--url', help="serveur a solliciter, ex. http://localhost:5173")
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS),
+                        help="endpoints a mesurer, separes par des virgules")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10, help="secondes par endpoint")
+    parser.add_argument('--requests', type=int, default=None, help="plafond de requetes par endpoint")
+    parser.add_argument('--baseline', help="reference JSON a comparer")
+    parser.add_argument('--save-baseline', help="enregistrer les resultats comme reference")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    names = [name for name in args.endpoints.split(',') if name]
+    unknown = [name for name in names if name not in ENDPOINTS]
+    if unknown:
+        parser.error(f"endpoints inconnus : {', '.join(unknown)}")
+
+    if args.url:
+        def make_client():
+            return HttpClient(args.url)
+    else:
+        import api_backend
+        if args.db:
+            api_backend.DB_NAME = args.db
+        api_backend.init_database()
+
+        def make_client():
+            return FlaskClient(api_backend.app)
+
+    token = make_client().login()
+    print(f"Cible : {args.url or 'client de test Flask'} - {args.concurrency} clients, "
+          f"{args.duration:.0f}s par endpoint")
+    print(f"  {'endpoint':<15} {'requetes':>8} {'erreurs':>7} {'req/s':>8} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+
+    results = {}
+    for name in names:
+        result = results[name] = run_endpoint(make_client, token, name, args.concurrency,
+                                              args.duration, args.requests)
+        print(f"  {name:<15} {result['requests']:>8} {result['errors']:>7} "
+              f"{result['throughput'] or 0:>8.1f} {result['p50_ms'] or 0:>9.2f} "
+              f"{result['p95_ms'] or 0:>9.2f} {result['p99_ms'] or 0:>9.2f}")
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'target': args.url or args.db or 'smartcity.db',
+        'concurrency': args.concurrency,
+        'duration': args.duration,
+        'python': platform.python_version(),
+        'machine': platform.node(),
+        'results': results,
+    }
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        lines, regressions = compare(results, baseline, args.tolerance)
+        print(f"\nComparaison a {args.baseline} ({baseline.get('created_at')}) :")
+        print('\n'.join(lines) if lines else "  aucun endpoint comparable")
+        if regressions:
+            print(f"Regression au-dela de {args.tolerance:.0%} : {', '.join(regressions)}")
+            status = 1
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nReference enregistree dans {args.save_baseline}")
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,334 @@
+"""
+Couche d'accès SQLite partagée - Smart City
+Pool de connexions réutilisables (API, collecteur, prédictions)
+Mode WAL : les lectures ne bloquent jamais derrière les écritures du collecteur
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+# ========================================
+# CONFIGURATION
+# ========================================
+DB_NAME = "smartcity.db"
+
+# Nombre maximum de connexions ouvertes simultanément par processus
+POOL_SIZE = int(os.environ.get('SMARTCITY_DB_POOL_SIZE', 8))
+# Délai d'attente d'une connexion libre quand le pool est saturé (secondes)
+POOL_TIMEOUT = float(os.environ.get('SMARTCITY_DB_POOL_TIMEOUT', 30))
+# Nombre de requêtes préparées gardées en cache par connexion
+STATEMENT_CACHE_SIZE = 256
+# Requêtes non closes suivies par connexion (les plus anciennes sont signalées au-delà)
+MAX_OPEN_STATEMENTS = 64
+
+PRAGMAS = {
+    # Avant toute table (et avant WAL) pour être pris en compte sur une base neuve ;
+    # base existante : python retention.py --vacuum
+    'auto_vacuum': 'INCREMENTAL',
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',     # sûr en WAL, un fsync par checkpoint seulement
+    'cache_size': -32000,        # ~32 Mo de cache de pages
+    'mmap_size': 268435456,      # 256 Mo lus via mmap
+    'busy_timeout': 5000,        # attendre le verrou d'écriture au lieu d'échouer
+    'temp_store': 'MEMORY'
+}
+
+# ========================================
+# TEMPS PASSÉ DANS SQLITE
+# ========================================
+
+_timing = threading.local()
+
+def sql_time():
+    """Secondes cumulées passées dans SQLite par le thread courant"""
+    return getattr(_timing, 'seconds', 0.0)
+
+def _add_sql_time(seconds):
+    _timing.seconds = getattr(_timing, 'seconds', 0.0) + seconds
+
+
+# Appelés à la fin de chaque requête : observer(connexion, sql, paramètres, secondes, is_many)
+# is_many : paramètres d'un executemany (suite de jeux) plutôt que d'un execute
+query_observers = []
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Curseur mesurant chaque requête, exécution et lecture des résultats comprises
+
+    Une requête est close (et signalée aux observateurs) quand ses résultats sont
+    épuisés, à la requête suivante du curseur ou à close() ; sinon (ex. un fetchone()
+    puis curseur abandonné), quand la connexion est rendue au pool, par le thread qui
+    la détient. La connexion ne garde que l'état de la requête [sql, paramètres,
+    is_many, secondes], pas le curseur : sa requête SQLite est libérée avec lui.
+    """
+
+    _statement = None
+
+    def _begin(self, sql, parameters, is_many=False):
+        self._finish()
+        self._statement = [sql, parameters, is_many, 0.0]
+        self.connection.track(self._statement)
+
+    def _timed(self, started):
+        elapsed = time.perf_counter() - started
+        _add_sql_time(elapsed)
+        if self._statement is not None:
+            self._statement[3] += elapsed
+
+    def _finish(self):
+        statement = self._statement
+        if statement is None:
+            return
+        self._statement = None
+        self.connection.report(statement)
+
+    def execute(self, sql, parameters=()):
+        self._begin(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._timed(started)
+            if self.description is None:
+                self._finish()
+
+    def executemany(self, sql, seq_of_parameters):
+        self._begin(sql, seq_of_parameters, is_many=True)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._timed(started)
+            self._finish()
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = None
+        try:
+            row = super().fetchone()
+            return row
+        finally:
+            self._timed(started)
+            if row is None:
+                self._finish()
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        started = time.perf_counter()
+        rows = []
+        try:
+            rows = super().fetchmany(size)
+            return rows
+        finally:
+            self._timed(started)
+            if len(rows) < size:
+                self._finish()
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._timed(started)
+            self._finish()
+
+    def close(self):
+        self._finish()
+        super().close()
+
+# ========================================
+# CONNEXIONS POOLÉES
+# ========================================
+
+class PooledConnection(sqlite3.Connection):
+    """Connexion SQLite dont close() la rend au pool au lieu de la fermer"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = None
+        self.depth = 0
+        # Requêtes pas encore signalées, par id (dict ordonné : plus ancienne d'abord)
+        self.open_statements = {}
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def track(self, statement):
+        self.open_statements[id(statement)] = statement
+        if len(self.open_statements) > MAX_OPEN_STATEMENTS:
+            self.report(next(iter(self.open_statements.values())))
+
+    def report(self, statement):
+        """Signaler une requête aux observateurs (une seule fois)"""
+        if self.open_statements.pop(id(statement), None) is None:
+            return
+        sql, parameters, is_many, seconds = statement
+        for observer in query_observers:
+            observer(self, sql, parameters, seconds, is_many)
+
+    def finish_statements(self):
+        """Signaler les requêtes dont les résultats n'ont pas été épuisés"""
+        for statement in list(self.open_statements.values()):
+            self.report(statement)
+
+    # Raccourcis de sqlite3.Connection redirigés vers un curseur mesuré
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        if self.pool is None:
+            self.finish_statements()
+            super().close()
+        else:
+            self.pool.release(self)
+
+    def really_close(self):
+        self.open_statements.clear()
+        super().close()
+
+
+class ConnectionPool:
+    """Pool borné de connexions SQLite, réutilisées par thread"""
+
+    def __init__(self, db_name=DB_NAME, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.db_name = db_name
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all = []
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_name,
+            timeout=PRAGMAS['busy_timeout'] / 1000,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            factory=PooledConnection
+        )
+        for name, value in PRAGMAS.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        conn.pool = self
+        with self._lock:
+            self._all.append(conn)
+        return conn
+
+    def acquire(self, row_factory=None):
+        """Obtenir une connexion (la même si le thread en détient déjà une)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.depth += 1
+            return conn
+
+        if not self._slots.acquire(timeout=self.timeout):
+            raise sqlite3.OperationalError(
+                f"Pool SQLite saturé ({self.size} connexions utilisées)")
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                conn = self._connect()
+            except Exception:
+                self._slots.release()
+                raise
+
+        conn.row_factory = row_factory
+        conn.depth = 1
+        self._local.conn = conn
+        return conn
+
+    def release(self, conn):
+        """Rendre la connexion au pool quand le dernier utilisateur du thread a fini"""
+        conn.depth -= 1
+        if conn.depth > 0:
+            return
+
+        conn.finish_statements()
+        if conn.in_transaction:
+            conn.rollback()
+        self._local.conn = None
+        self._idle.put(conn)
+        self._slots.release()
+
+    def release_current(self):
+        """Rendre la connexion du thread courant même si un close() a été oublié"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.depth = 1
+            self.release(conn)
+
+    def close_all(self):
+        """Fermer réellement toutes les connexions ouvertes par ce pool"""
+        with self._lock:
+            connections, self._all = self._all, []
+        for conn in connections:
+            try:
+                conn.really_close()
+            except sqlite3.Error:
+                pass
+        self._idle = queue.LifoQueue()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(db_name=DB_NAME):
+    """Pool partagé du processus pour un fichier de base donné"""
+    pool = _pools.get(db_name)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(db_name)
+            if pool is None:
+                pool = _pools[db_name] = ConnectionPool(db_name)
+    return pool
+
+def connect(db_name=DB_NAME, row_factory=None):
+    """Équivalent de sqlite3.connect() servi par le pool (close() rend la connexion)"""
+    return get_pool(db_name).acquire(row_factory)
+
+def release_current(db_name=DB_NAME):
+    """À appeler en fin de requête / de cycle pour ne jamais fuir de connexion"""
+    pool = _pools.get(db_name)
+    if pool is not None:
+        pool.release_current()
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_all()
+
+def _reset_after_fork():
+    """Une connexion SQLite ne doit pas traverser un fork : pools neufs dans l'enfant
+    (les connexions héritées sont abandonnées sans être fermées)"""
+    global _pools, _pools_lock
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+# ========================================
+# GÉNÉRATION DES DONNÉES
+# ========================================
+
+def get_data_version(conn):
+    """Numéro de génération courant (0 si la migration n'est pas encore passée)"""
+    try:
+        row = conn.execute('SELECT generation FROM data_version WHERE id = 1').fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] if row else 0
+
+def bump_data_version(cursor):
+    """À exécuter dans la transaction qui écrit de nouvelles mesures"""
+    cursor.execute('UPDATE data_version SET generation = generation + 1 WHERE id = 1')
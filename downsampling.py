@@ -0,0 +1,104 @@
+"""
+Sous-échantillonnage des séries temporelles - Smart City
+Agrégation SQL par seaux de temps puis LTTB (Largest-Triangle-Three-Buckets)
+Taille des séries renvoyées au dashboard bornée, pics conservés
+"""
+
+import time
+
+# Seaux SQL pré-agrégés par point final : LTTB choisit ensuite parmi eux
+PREBUCKET_FACTOR = 4
+
+DEFAULT_MAX_POINTS = 500
+MIN_POINTS = 10
+MAX_POINTS = 5000
+
+# ========================================
+# LTTB
+# ========================================
+
+def lttb(rows, threshold, x_index=0, y_index=1):
+    """Garder threshold lignes qui préservent la forme visuelle (pics compris)
+
+    rows : séquence de tuples triés par x ; les y None comptent comme 0.
+    """
+    count = len(rows)
+    if threshold >= count or threshold < 3:
+        return list(rows)
+
+    def y(row):
+        return row[y_index] or 0
+
+    sampled = [rows[0]]
+    every = (count - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        # Moyenne du seau suivant : troisième sommet du triangle
+        next_start = int((i + 1) * every) + 1
+        next_end = min(max(int((i + 2) * every) + 1, next_start + 1), count)
+        span = next_end - next_start
+        avg_x = sum(rows[j][x_index] for j in range(next_start, next_end)) / span
+        avg_y = sum(y(rows[j]) for j in range(next_start, next_end)) / span
+
+        # Point du seau courant formant le plus grand triangle
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        ax, ay = rows[a][x_index], y(rows[a])
+        best_area = -1
+        best = start
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (y(rows[j]) - ay) - (ax - rows[j][x_index]) * (avg_y - ay))
+            if area > best_area:
+                best_area = area
+                best = j
+
+        sampled.append(rows[best])
+        a = best
+
+    sampled.append(rows[-1])
+    return sampled
+
+# ========================================
+# SÉRIES DU DASHBOARD
+# ========================================
+
+def clamp_max_points(value):
+    try:
+        points = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_MAX_POINTS
+    return max(MIN_POINTS, min(MAX_POINTS, points))
+
+def bucketed_series(cursor, table, columns, since, max_points, y_column, station_ids=None):
+    """Série [{'time': 'HH:MM', colonne: valeur, ...}] d'au plus max_points points
+
+    station_ids : limiter aux stations données (index station_id, ts), None : toutes.
+    y_column est pré-agrégée par MAX (une moyenne effacerait les pics avant LTTB),
+    les autres colonnes par AVG.
+    """
+    window = max(1, int(time.time()) - since)
+    bucket = max(1, window // (max_points * PREBUCKET_FACTOR))
+    aggregates = ', '.join(f"{'MAX' if column == y_column else 'AVG'}({column})" for column in columns)
+    where = 'ts >= ?'
+    params = [bucket, bucket, since]
+    if station_ids is not None:
+        where += f" AND station_id IN ({', '.join('?' for _ in station_ids)})"
+        params.extend(station_ids)
+    cursor.execute(f'''
+        SELECT (ts / ?) * ? as bucket_ts, {aggregates}
+        FROM {table}
+        WHERE {where}
+        GROUP BY ts / ?
+        ORDER BY bucket_ts ASC
+    ''', params + [bucket])
+
+    rows = lttb(cursor.fetchall(), max_points, 0, 1 + columns.index(y_column))
+
+    series = []
+    for row in rows:
+        point = {'time': time.strftime('%H:%M', time.gmtime(row[0]))}
+        for column, value in zip(columns, row[1:]):
+            point[column] = round(value, 1) if value is not None else None
+        series.append(point)
+    return series
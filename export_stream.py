@@ -0,0 +1,81 @@
+"""
+Export en flux des séries temporelles - Smart City
+Lecture par lots (fetchmany) et génération NDJSON / CSV à mémoire constante
+"""
+
+import csv
+import io
+import json
+
+import db_pool
+
+# ========================================
+# CONFIGURATION
+# ========================================
+EXPORT_TABLES = ('air_quality', 'weather', 'iot_sensors', 'alerts')
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+BATCH_SIZE = 2000
+
+# ========================================
+# VALIDATION
+# ========================================
+
+def export_columns(conn, table, requested=None):
+    """Colonnes à exporter, validées contre le schéma (ValueError sinon)"""
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Table inconnue: {table}")
+    available = [row[1] for row in conn.execute(f'PRAGMA table_info({table})').fetchall()]
+    if not requested:
+        return available
+    unknown = [column for column in requested if column not in available]
+    if unknown:
+        raise ValueError(f"Colonnes inconnues: {', '.join(unknown)}")
+    return list(requested)
+
+# ========================================
+# LECTURE EN FLUX
+# ========================================
+
+def iter_batches(db_name, table, columns, start, end, batch_size=BATCH_SIZE):
+    """Lots de lignes [start, end[ par ts croissant ; la connexion est rendue à la fin"""
+    conn = db_pool.connect(db_name)
+    try:
+        cursor = conn.cursor()
+        cursor.arraysize = batch_size
+        cursor.execute(f'''
+            SELECT {', '.join(columns)} FROM {table}
+            WHERE ts >= ? AND ts < ?
+            ORDER BY ts ASC
+        ''', (start, end))
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+def ndjson_stream(columns, batches):
+    for rows in batches:
+        yield ''.join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n' for row in rows)
+
+def csv_stream(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def export_stream(db_name, table, columns, start, end, format_type):
+    batches = iter_batches(db_name, table, columns, start, end)
+    if format_type == 'csv':
+        return csv_stream(columns, batches)
+    return ndjson_stream(columns, batches)
@@ -0,0 +1,33 @@
+"""
+Configuration gunicorn - Smart City (mode production)
+Toutes les valeurs sont surchargeables par variables d'environnement
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('SMARTCITY_BIND', '0.0.0.0:5173')
+
+# Processus x threads : les threads servent les requêtes lentes (SSE, exports)
+# sans bloquer un processus entier
+workers = int(os.environ.get('SMARTCITY_WORKERS', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+threads = int(os.environ.get('SMARTCITY_THREADS', 8))
+worker_class = 'gthread'
+
+keepalive = int(os.environ.get('SMARTCITY_KEEPALIVE', 5))
+timeout = int(os.environ.get('SMARTCITY_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('SMARTCITY_GRACEFUL_TIMEOUT', 30))
+# Recyclage périodique des workers (avec gigue pour éviter les redémarrages simultanés)
+max_requests = int(os.environ.get('SMARTCITY_MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+
+# Charger l'application (schéma, prédictions, caches) une seule fois avant le fork
+preload_app = True
+pidfile = os.environ.get('SMARTCITY_PIDFILE', '.gunicorn.pid')
+
+accesslog = '-'
+errorlog = '-'
+
+def post_fork(server, worker):
+    import wsgi
+    wsgi.start_worker_services()
@@ -0,0 +1,66 @@
+"""
+GET conditionnels et compression HTTP - Smart City
+ETag fort + 304 Not Modified sur If-None-Match, négociation gzip / deflate
+Appliqué à toutes les réponses /api non streamées
+"""
+
+import gzip
+import hashlib
+import zlib
+
+# ========================================
+# CONFIGURATION
+# ========================================
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_LEVEL = 6
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/csv', 'text/plain', 'application/x-ndjson'}
+
+# ========================================
+# ETAG
+# ========================================
+
+def make_etag(body, version=None):
+    """ETag fort : génération des données (si connue) + empreinte du contenu"""
+    digest = hashlib.sha1(body).hexdigest()[:16]
+    return f"{version:x}-{digest}" if version is not None else digest
+
+def _compress(body, encoding):
+    if encoding == 'gzip':
+        return gzip.compress(body, COMPRESS_LEVEL, mtime=0)
+    return zlib.compress(body, COMPRESS_LEVEL)
+
+# ========================================
+# POST-TRAITEMENT DES RÉPONSES
+# ========================================
+
+def finalize_response(request, response):
+    """ETag, 304 et compression ; les flux (SSE, exports) et fichiers sont laissés tels quels"""
+    if (request.method not in ('GET', 'HEAD') or response.status_code != 200
+            or response.is_streamed or response.direct_passthrough
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    body = response.get_data()
+    etag, _ = response.get_etag()
+    if etag is None:
+        etag = make_etag(body)
+
+    encoding = None
+    if response.mimetype in COMPRESSIBLE_MIMETYPES and len(body) >= COMPRESS_MIN_BYTES:
+        encoding = request.accept_encodings.best_match(['gzip', 'deflate'])
+    variant = f"{etag}-{encoding}" if encoding else etag
+
+    response.vary.add('Accept-Encoding')
+    if request.if_none_match.contains(variant) or request.if_none_match.contains(etag):
+        response.status_code = 304
+        response.set_data(b'')
+        response.headers.pop('Content-Type', None)
+        response.headers.pop('Content-Length', None)
+        response.set_etag(variant)
+        return response
+
+    if encoding:
+        response.set_data(_compress(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+    response.set_etag(variant)
+    return response
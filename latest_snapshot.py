@@ -0,0 +1,122 @@
+"""
+Dernières mesures - Smart City
+Table latest_readings (une ligne par source et par station / capteur) tenue à jour
+par trigger dans la transaction de chaque insertion, et miroir mémoire côté API
+"""
+
+import json
+import threading
+
+# Source -> colonne identifiant la série (station ou capteur)
+SOURCES = {
+    'air_quality': 'station_id',
+    'weather': 'station_id',
+    'iot_sensors': 'sensor_id',
+}
+
+# ========================================
+# SCHÉMA
+# ========================================
+
+def create_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS latest_readings (
+            source TEXT NOT NULL,
+            source_id TEXT NOT NULL,
+            ts INTEGER,
+            row_id INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            PRIMARY KEY (source, source_id)
+        ) WITHOUT ROWID
+    ''')
+
+def _columns(cursor, source):
+    cursor.execute(f'PRAGMA table_info({source})')
+    return [row[1] for row in cursor.fetchall()]
+
+def _sources(cursor):
+    """Sources dont la colonne clé existe (base en cours de migration : les autres attendent)"""
+    return {source: key_column for source, key_column in SOURCES.items()
+            if key_column in _columns(cursor, source)}
+
+def _payload_sql(cursor, source, alias):
+    """json_object(...) reprenant toutes les colonnes de la ligne"""
+    columns = _columns(cursor, source)
+    return 'json_object(' + ', '.join(f"'{column}', {alias}.{column}" for column in columns) + ')'
+
+def install_triggers(cursor):
+    """(Re)créer les triggers ; à rappeler après tout changement de colonnes"""
+    for source, key_column in _sources(cursor).items():
+        cursor.execute(f'DROP TRIGGER IF EXISTS trg_{source}_latest')
+        cursor.execute(f'''
+            CREATE TRIGGER trg_{source}_latest
+            AFTER INSERT ON {source}
+            WHEN NEW.{key_column} IS NOT NULL
+            BEGIN
+                INSERT INTO latest_readings (source, source_id, ts, row_id, payload)
+                VALUES (
+                    '{source}',
+                    NEW.{key_column},
+                    COALESCE(NEW.ts, CAST(strftime('%s', NEW.timestamp) AS INTEGER)),
+                    NEW.id,
+                    {_payload_sql(cursor, source, 'NEW')}
+                )
+                ON CONFLICT (source, source_id) DO UPDATE SET
+                    ts = excluded.ts,
+                    row_id = excluded.row_id,
+                    payload = excluded.payload
+                WHERE excluded.row_id > latest_readings.row_id;
+            END
+        ''')
+
+def rebuild(cursor):
+    """Remplir latest_readings depuis l'historique existant"""
+    cursor.execute('DELETE FROM latest_readings')
+    for source, key_column in _sources(cursor).items():
+        cursor.execute(f'''
+            INSERT INTO latest_readings (source, source_id, ts, row_id, payload)
+            SELECT '{source}', t.{key_column}, t.ts, t.id, {_payload_sql(cursor, source, 't')}
+            FROM {source} t
+            WHERE t.id IN (
+                SELECT MAX(id) FROM {source}
+                WHERE {key_column} IS NOT NULL
+                GROUP BY {key_column}
+            )
+        ''')
+
+# ========================================
+# MIROIR MÉMOIRE (API)
+# ========================================
+
+class LatestSnapshot:
+    """Copie mémoire de latest_readings, rechargée quand la génération change"""
+
+    def __init__(self):
+        self._version = None
+        self._readings = {source: {} for source in SOURCES}
+        self._lock = threading.Lock()
+
+    def refresh(self, conn, version):
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            readings = {source: {} for source in SOURCES}
+            for source, source_id, payload in conn.execute(
+                    'SELECT source, source_id, payload FROM latest_readings').fetchall():
+                if source in readings:
+                    readings[source][source_id] = json.loads(payload)
+            self._readings = readings
+            self._version = version
+
+    def latest(self, source, keys=None):
+        """Ligne la plus récente de la source, toutes séries confondues (ou parmi keys)"""
+        rows = self.all(source, keys)
+        return max(rows, key=lambda row: (row.get('ts') or 0, row['id']), default=None)
+
+    def all(self, source, keys=None):
+        """Dernière ligne de chaque série de la source (ou des séries keys), triées par identifiant"""
+        readings = self._readings[source]
+        selected = sorted(readings) if keys is None else sorted(key for key in keys if key in readings)
+        return [readings[key] for key in selected]
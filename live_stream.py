@@ -0,0 +1,210 @@
+"""
+Flux temps réel (Server-Sent Events) - Smart City
+Un seul détecteur de changements interroge la base, puis diffuse les
+nouvelles lignes à tous les abonnés (file bornée par client, reprise via Last-Event-ID)
+"""
+
+import json
+import queue
+import threading
+import time
+
+import db_pool
+
+# ========================================
+# CONFIGURATION
+# ========================================
+STREAM_TABLES = ('air_quality', 'weather', 'iot_sensors', 'alerts')
+# Colonnes trop lourdes pour être poussées à chaque mesure
+EXCLUDED_COLUMNS = {'raw_data'}
+
+POLL_INTERVAL_SECONDS = 1.0
+HEARTBEAT_SECONDS = 15
+# Événements en attente au-delà desquels un client trop lent est déconnecté
+# (il se reconnecte avec Last-Event-ID et rattrape depuis la base)
+CLIENT_QUEUE_SIZE = 1000
+# Lignes max rejouées par table à la reconnexion (les plus récentes)
+REPLAY_LIMIT = 500
+FETCH_LIMIT = 5000
+
+# ========================================
+# CURSEUR DE REPRISE
+# ========================================
+# L'identifiant d'événement encode le dernier id vu dans chaque table,
+# ex. "120-41-360-57" : la reprise fonctionne même après redémarrage de l'API
+
+def format_event_id(positions):
+    return '-'.join(str(positions[table]) for table in STREAM_TABLES)
+
+def parse_event_id(value):
+    if not value:
+        return None
+    parts = value.split('-')
+    if len(parts) != len(STREAM_TABLES) or not all(part.isdigit() for part in parts):
+        return None
+    return dict(zip(STREAM_TABLES, (int(part) for part in parts)))
+
+def format_event(event_id, table, row):
+    return f"id: {event_id}\nevent: {table}\ndata: {json.dumps(row, ensure_ascii=False)}\n\n"
+
+def _row_dict(cursor, row):
+    return {description[0]: value for description, value in zip(cursor.description, row)
+            if description[0] not in EXCLUDED_COLUMNS}
+
+def _fetch_after(cursor, table, after_id, limit, newest=False):
+    if newest:
+        cursor.execute(f'SELECT * FROM {table} WHERE id > ? ORDER BY id DESC LIMIT ?',
+                       (after_id, limit))
+        rows = cursor.fetchall()[::-1]
+    else:
+        cursor.execute(f'SELECT * FROM {table} WHERE id > ? ORDER BY id ASC LIMIT ?',
+                       (after_id, limit))
+        rows = cursor.fetchall()
+    return [_row_dict(cursor, row) for row in rows]
+
+def _sequence(positions, batches):
+    """Transformer des lignes par table en événements ordonnés (id, table, ligne)"""
+    merged = [(row.get('ts') or 0, STREAM_TABLES.index(table), row['id'], table, row)
+              for table, rows in batches.items() for row in rows]
+    merged.sort(key=lambda item: item[:3])
+    positions = dict(positions)
+    events = []
+    for _, _, row_id, table, row in merged:
+        positions[table] = max(positions[table], row_id)
+        events.append((format_event_id(positions), table, row))
+    return events, positions
+
+# ========================================
+# DIFFUSION
+# ========================================
+
+class Subscription:
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize)
+        self.overflowed = False
+
+
+class ChangeBroadcaster:
+    """Détecteur unique de nouvelles lignes, diffusées à tous les abonnés"""
+
+    def __init__(self, db_name=db_pool.DB_NAME, interval=POLL_INTERVAL_SECONDS):
+        self.db_name = db_name
+        self.interval = interval
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._positions = None
+        self._version = None
+
+    def ensure_started(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            conn = db_pool.connect(self.db_name)
+            try:
+                self._positions = {
+                    table: conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}').fetchone()[0]
+                    for table in STREAM_TABLES
+                }
+                self._version = db_pool.get_data_version(conn)
+            finally:
+                conn.close()
+            self._thread = threading.Thread(target=self._run, name='sse-broadcaster', daemon=True)
+            self._thread.start()
+
+    def subscribe(self):
+        self.ensure_started()
+        subscription = Subscription(CLIENT_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def replay(self, positions):
+        """Événements manqués depuis positions (lus en base, bornés par REPLAY_LIMIT)"""
+        conn = db_pool.connect(self.db_name)
+        try:
+            cursor = conn.cursor()
+            batches = {table: _fetch_after(cursor, table, positions[table], REPLAY_LIMIT, newest=True)
+                       for table in STREAM_TABLES}
+        finally:
+            conn.close()
+        events, _ = _sequence(positions, batches)
+        return events
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                idle = not self._subscribers
+            if idle:
+                continue
+            try:
+                self._tick()
+            except Exception as e:
+                print(f"Erreur flux temps reel: {e}")
+            finally:
+                db_pool.release_current(self.db_name)
+
+    def _tick(self):
+        while True:
+            conn = db_pool.connect(self.db_name)
+            try:
+                version = db_pool.get_data_version(conn)
+                if version == self._version:
+                    return
+                cursor = conn.cursor()
+                batches = {table: _fetch_after(cursor, table, self._positions[table], FETCH_LIMIT)
+                           for table in STREAM_TABLES}
+            finally:
+                conn.close()
+
+            events, self._positions = _sequence(self._positions, batches)
+            if events:
+                self._publish(events)
+            # Un lot plein laisse des lignes en base : relire aussitôt, version inchangée
+            if all(len(rows) < FETCH_LIMIT for rows in batches.values()):
+                self._version = version
+                return
+
+    def _publish(self, events):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            if subscription.overflowed:
+                continue
+            for event in events:
+                try:
+                    subscription.queue.put_nowait(event)
+                except queue.Full:
+                    subscription.overflowed = True
+                    break
+
+    def stream(self, last_event_id=None):
+        """Générateur de texte SSE pour un client"""
+        subscription = self.subscribe()
+        try:
+            yield f"retry: {int(POLL_INTERVAL_SECONDS * 3000)}\n\n"
+
+            # Rattrapage : la file d'abonnement est déjà active, les doublons sont filtrés
+            seen = dict(self._positions)
+            resume = parse_event_id(last_event_id)
+            if resume is not None:
+                for event_id, table, row in self.replay(resume):
+                    seen[table] = max(seen[table], row['id'])
+                    yield format_event(event_id, table, row)
+
+            while not subscription.overflowed:
+                try:
+                    event_id, table, row = subscription.queue.get(timeout=HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if resume is not None and row['id'] <= seen[table]:
+                    continue
+                yield format_event(event_id, table, row)
+        finally:
+            self.unsubscribe(subscription)
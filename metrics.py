@@ -0,0 +1,232 @@
+"""
+Métriques - Smart City
+Compteurs, jauges et histogrammes exposés au format texte Prometheus
+Fichiers texte partagés entre processus (collecteur, workers gunicorn) fusionnés par /api/metrics
+"""
+
+import bisect
+import os
+import threading
+import time
+
+# ========================================
+# CONFIGURATION
+# ========================================
+METRICS_DIR = os.environ.get('SMARTCITY_METRICS_DIR', 'metrics')
+# Fichier d'un processus ignoré s'il n'a pas été réécrit depuis (processus arrêté)
+STALE_SECONDS = float(os.environ.get('SMARTCITY_METRICS_STALE_SECONDS', 120))
+EXPORT_INTERVAL_SECONDS = 15
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# ========================================
+# TYPES DE MÉTRIQUES
+# ========================================
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.registry = registry
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} attend les labels {self.labelnames}")
+        return tuple(str(label) for label in labels)
+
+    def _label_pairs(self, key, extra=()):
+        const = self.registry.const_labels if self.registry is not None else {}
+        names = tuple(const) + self.labelnames + tuple(name for name, _ in extra)
+        values = tuple(const.values()) + key + tuple(value for _, value in extra)
+        return _format_labels(names, values)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        return [f'{self.name}{self._label_pairs(key)} {_format_value(value)}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value, *labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """Histogramme cumulatif à seaux fixes (_bucket / _sum / _count)"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def _samples(self, key, state):
+        counts, total = state[0], state[1]
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            labels = self._label_pairs(key, (('le', _format_value(float(bound))),))
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        lines.append(f'{self.name}_sum{self._label_pairs(key)} {_format_value(total)}')
+        lines.append(f'{self.name}_count{self._label_pairs(key)} {cumulative}')
+        return lines
+
+# ========================================
+# REGISTRE
+# ========================================
+
+class Registry:
+    """Ensemble des métriques d'un processus"""
+
+    def __init__(self, const_labels=None):
+        self.const_labels = dict(const_labels or {})
+        self._metrics = []
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames, self))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames, self))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, self, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+# ========================================
+# FICHIERS TEXTE ENTRE PROCESSUS
+# ========================================
+
+def write_textfile(registry, name, directory=METRICS_DIR):
+    """Écrire l'exposition du registre dans <directory>/<name>.prom (remplacement atomique)"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{name}.prom')
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(registry.render())
+    os.replace(tmp_path, path)
+
+def read_textfiles(directory=METRICS_DIR, exclude=None):
+    """Expositions récentes des autres processus"""
+    try:
+        names = sorted(os.listdir(directory))
+    except FileNotFoundError:
+        return []
+    texts = []
+    now = time.time()
+    for name in names:
+        if not name.endswith('.prom') or name == f'{exclude}.prom':
+            continue
+        path = os.path.join(directory, name)
+        try:
+            age = now - os.path.getmtime(path)
+            if age > STALE_SECONDS:
+                # Worker recyclé depuis longtemps : le fichier ne sera plus réécrit
+                if age > 86400:
+                    os.remove(path)
+                continue
+            with open(path, encoding='utf-8') as f:
+                texts.append(f.read())
+        except OSError:
+            continue
+    return texts
+
+def merge_expositions(texts):
+    """Regrouper les échantillons par famille (un seul HELP/TYPE par métrique)"""
+    families = {}
+    current = None
+    for text in texts:
+        for line in text.splitlines():
+            if not line:
+                continue
+            if line.startswith('# HELP ') or line.startswith('# TYPE '):
+                name = line.split(' ', 3)[2]
+                family = families.setdefault(name, {'HELP': None, 'TYPE': None, 'samples': []})
+                family[line[2:6]] = family[line[2:6]] or line
+                current = family
+            elif not line.startswith('#') and current is not None:
+                current['samples'].append(line)
+    lines = []
+    for family in families.values():
+        lines.extend(line for line in (family['HELP'], family['TYPE']) if line)
+        lines.extend(family['samples'])
+    return '\n'.join(lines) + '\n'
+
+def start_textfile_exporter(registry, name, interval=EXPORT_INTERVAL_SECONDS, directory=METRICS_DIR):
+    """Thread réécrivant périodiquement le fichier du processus"""
+    def run():
+        while True:
+            try:
+                write_textfile(registry, name, directory)
+            except OSError as e:
+                print(f"Erreur export metriques: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name='metrics-exporter', daemon=True)
+    thread.start()
+    return thread
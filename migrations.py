@@ -0,0 +1,186 @@
+"""
+Migrations du schéma - Smart City
+Mise à niveau en place d'une base existante, versionnée par PRAGMA user_version
+Chaque migration s'exécute dans sa propre transaction
+"""
+
+import sqlite3
+
+import latest_snapshot
+import raw_payloads
+import rollups
+import stations
+
+# Tables de séries temporelles créées par init_database()
+TIME_SERIES_TABLES = ('air_quality', 'weather', 'iot_sensors', 'alerts')
+# Tables dont les lignes sont rattachées à une station (colonne station_id)
+STATION_TABLES = ('air_quality', 'weather', 'alerts')
+
+# ========================================
+# OUTILS
+# ========================================
+
+def table_columns(cursor, table):
+    cursor.execute(f'PRAGMA table_info({table})')
+    return [row[1] for row in cursor.fetchall()]
+
+def add_column(cursor, table, column, definition):
+    """ALTER TABLE ADD COLUMN idempotent"""
+    if column not in table_columns(cursor, table):
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+# ========================================
+# MIGRATIONS
+# ========================================
+
+def migrate_epoch_timestamps(cursor):
+    """Colonne ts (epoch UTC entier) indexée sur les séries temporelles"""
+    for table in TIME_SERIES_TABLES:
+        add_column(cursor, table, 'ts', 'INTEGER')
+        cursor.execute(f'''
+            UPDATE {table} SET ts = CAST(strftime('%s', timestamp) AS INTEGER)
+            WHERE ts IS NULL
+        ''')
+        # Filet de sécurité pour les écrivains qui ne renseignent pas ts
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_ts
+            AFTER INSERT ON {table}
+            WHEN NEW.ts IS NULL
+            BEGIN
+                UPDATE {table} SET ts = CAST(strftime('%s', NEW.timestamp) AS INTEGER)
+                WHERE id = NEW.id;
+            END
+        ''')
+
+    indexes = [
+        ('idx_air_quality_ts', 'air_quality', 'ts'),
+        ('idx_air_quality_city_ts', 'air_quality', 'city, ts'),
+        ('idx_weather_ts', 'weather', 'ts'),
+        ('idx_weather_city_ts', 'weather', 'city, ts'),
+        ('idx_iot_sensors_ts', 'iot_sensors', 'ts'),
+        ('idx_iot_sensors_sensor_ts', 'iot_sensors', 'sensor_id, ts'),
+        ('idx_iot_sensors_location_ts', 'iot_sensors', 'location_name, ts'),
+        ('idx_alerts_ts', 'alerts', 'ts'),
+        ('idx_alerts_status_ts', 'alerts', 'status, ts'),
+    ]
+    for name, table, columns in indexes:
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})')
+
+def migrate_data_version(cursor):
+    """Compteur de génération incrémenté à chaque écriture du collecteur"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS data_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            generation INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO data_version (id, generation) VALUES (1, 0)')
+
+def migrate_rollups(cursor):
+    """Tables d'agrégats minute / heure / jour, remplies depuis l'historique"""
+    rollups.create_tables(cursor)
+    rollups.rebuild(cursor)
+
+def migrate_latest_readings(cursor):
+    """Table des dernières mesures, tenue à jour par trigger"""
+    latest_snapshot.create_table(cursor)
+    latest_snapshot.install_triggers(cursor)
+    latest_snapshot.rebuild(cursor)
+
+def migrate_alert_filters(cursor):
+    """Index des filtres de l'historique d'alertes (zone, niveau, type)"""
+    for column in ('zone', 'level', 'type'):
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_alerts_{column}_ts ON alerts ({column}, ts)')
+
+def migrate_raw_payloads(cursor):
+    """Réponses brutes (raw_data) déplacées vers raw_payloads, compressées et dédupliquées"""
+    raw_payloads.create_table(cursor)
+    for table in raw_payloads.RAW_TABLES:
+        add_column(cursor, table, 'raw_id', 'INTEGER')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_raw_id ON {table} (raw_id)')
+        if 'raw_data' in table_columns(cursor, table):
+            raw_payloads.move_raw_data(cursor, table)
+
+    # Les triggers de latest_readings citent toutes les colonnes : retirés le temps du DROP COLUMN
+    for source in latest_snapshot.SOURCES:
+        cursor.execute(f'DROP TRIGGER IF EXISTS trg_{source}_latest')
+    for table in raw_payloads.RAW_TABLES:
+        if 'raw_data' not in table_columns(cursor, table):
+            continue
+        if sqlite3.sqlite_version_info >= (3, 35, 0):
+            cursor.execute(f'ALTER TABLE {table} DROP COLUMN raw_data')
+        else:
+            cursor.execute(f'UPDATE {table} SET raw_data = NULL')
+    latest_snapshot.install_triggers(cursor)
+    latest_snapshot.rebuild(cursor)
+
+def migrate_stations(cursor):
+    """Stations : colonne station_id indexée, mesures existantes rattachées à la station historique"""
+    stations.create_table(cursor)
+    cursor.execute('''
+        INSERT OR IGNORE INTO stations (id, city, name, lat, lon, waqi)
+        VALUES (:id, :city, :name, :lat, :lon, :waqi)
+    ''', stations.LEGACY_STATION)
+    for table in STATION_TABLES:
+        add_column(cursor, table, 'station_id', 'TEXT')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_station_ts ON {table} (station_id, ts)')
+
+    # Jusqu'ici le collecteur ne suivait que Paris (les alertes de prédiction restent sans station)
+    legacy_id = stations.LEGACY_STATION['id']
+    for table in ('air_quality', 'weather'):
+        cursor.execute(f'UPDATE {table} SET station_id = ? WHERE station_id IS NULL', (legacy_id,))
+    cursor.execute("UPDATE alerts SET station_id = ? WHERE station_id IS NULL AND type != 'Prédiction'",
+                   (legacy_id,))
+
+    # Dernières mesures désormais par station (et nouvelle colonne dans les copies JSON)
+    latest_snapshot.install_triggers(cursor)
+    latest_snapshot.rebuild(cursor)
+    rollups.rebuild(cursor, scopes=('station',))
+
+def migrate_alert_status_filters(cursor):
+    """Index (status, filtre, ts) : statut filtré par défaut ('active'), filtre et ordre ts couverts"""
+    for column in ('zone', 'level', 'type'):
+        cursor.execute(f'DROP INDEX IF EXISTS idx_alerts_{column}_ts')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_alerts_status_{column}_ts ON alerts (status, {column}, ts)')
+
+
+# (version, description, fonction) - ne jamais réordonner ni modifier une migration publiée
+MIGRATIONS = [
+    (1, "timestamps epoch + index series temporelles", migrate_epoch_timestamps),
+    (2, "compteur de generation des donnees", migrate_data_version),
+    (3, "agregats minute / heure / jour", migrate_rollups),
+    (4, "table des dernieres mesures", migrate_latest_readings),
+    (5, "index des filtres d'alertes", migrate_alert_filters),
+    (6, "reponses brutes hors des tables de mesures", migrate_raw_payloads),
+    (7, "stations et colonne station_id", migrate_stations),
+    (8, "index des filtres d'alertes par statut", migrate_alert_status_filters),
+]
+
+# ========================================
+# EXÉCUTION
+# ========================================
+
+def get_schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def apply_migrations(conn):
+    """Appliquer dans l'ordre les migrations plus récentes que la base"""
+    current = get_schema_version(conn)
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        if conn.in_transaction:
+            conn.commit()
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            migrate(cursor)
+            cursor.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"Migration {version} appliquee : {description}")
+        applied.append(version)
+    return applied
@@ -4,13 +4,14 @@ Génère des prédictions même avec peu de données
 Prédictions horaires pour les prochaines 24h
 """
 
-import sqlite3
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import json
 import os
 import warnings
+import db_pool
+import archive
 warnings.filterwarnings('ignore')
 
 # Chemin de la base de données
@@ -22,6 +23,13 @@ print("=" * 80)
 print(f"📂 Chemin DB: {DB_NAME}")
 print(f"📂 Existe: {'✅ OUI' if os.path.exists(DB_NAME) else '❌ NON'}")
 
+def save_predictions(predictions, predictions_path='predictions_24h.json'):
+    """Écriture atomique : l'API ne lit jamais un fichier à moitié écrit"""
+    tmp_path = predictions_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(predictions, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, predictions_path)
+
 def load_latest_data():
     """Charger les dernières données disponibles"""
     
@@ -29,7 +37,7 @@ def load_latest_data():
         print(f"❌ Base de données introuvable: {DB_NAME}")
         return None
     
-    conn = sqlite3.connect(DB_NAME)
+    conn = db_pool.connect(DB_NAME)
     
     try:
         # Récupérer les dernières données d'air quality
@@ -42,7 +50,7 @@ def load_latest_data():
             no2,
             o3
         FROM air_quality
-        ORDER BY timestamp DESC
+        ORDER BY ts DESC
         LIMIT 10
         """
         
@@ -57,7 +65,7 @@ def load_latest_data():
             pressure,
             wind_speed
         FROM weather
-        ORDER BY timestamp DESC
+        ORDER BY ts DESC
         LIMIT 10
         """
         
@@ -162,8 +170,7 @@ def generate_predictions_simple():
     # Sauvegarder en JSON
     predictions_path = 'predictions_24h.json'
     try:
-        with open(predictions_path, 'w', encoding='utf-8') as f:
-            json.dump(predictions, f, indent=2, ensure_ascii=False)
+        save_predictions(predictions, predictions_path)
         print(f"✅ {len(predictions)} prédictions générées")
         print(f"💾 Sauvegardées dans: {predictions_path}")
     except Exception as e:
@@ -218,21 +225,35 @@ def generate_default_predictions():
     
     # Sauvegarder
     predictions_path = 'predictions_24h.json'
-    with open(predictions_path, 'w', encoding='utf-8') as f:
-        json.dump(predictions, f, indent=2, ensure_ascii=False)
+    save_predictions(predictions, predictions_path)
     
     print(f"✅ {len(predictions)} prédictions par défaut générées")
     print(f"💾 Sauvegardées dans: {predictions_path}")
     
     return predictions
 
+def count_history(days=90):
+    """Lignes air quality archivées en Parquet sur days jours (0 si archive indisponible)
+
+    Simple comptage par métadonnées : l'historique ne sera chargé
+    (archive.load_dataframe) qu'une fois l'entraînement ML implémenté.
+    """
+    if archive.pa is None:
+        return 0
+    
+    today = datetime.now(timezone.utc).date()
+    count = archive.count_rows('air_quality', today - timedelta(days=days), today)
+    if count:
+        print(f"📦 Archive air quality: {count} enregistrements sur {days} jours")
+    return count
+
 def train_model_if_enough_data():
     """Entraîner un modèle uniquement si assez de données"""
     
     if not os.path.exists(DB_NAME):
         return None
     
-    conn = sqlite3.connect(DB_NAME)
+    conn = db_pool.connect(DB_NAME)
     cursor = conn.cursor()
     
     # Vérifier combien de données disponibles
@@ -240,6 +261,8 @@ def train_model_if_enough_data():
     count = cursor.fetchone()[0]
     conn.close()
     
+    count = max(count, count_history())
+    
     print(f"\n📊 Nombre d'enregistrements: {count}")
     
     if count < 50:
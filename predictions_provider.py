@@ -0,0 +1,111 @@
+"""
+Fournisseur de prédictions - Smart City
+predictions_24h.json gardé en mémoire, rechargé seulement si mtime / taille changent
+Un fichier en cours d'écriture n'est jamais servi : la version précédente reste active
+"""
+
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+PREDICTIONS_FILE = 'predictions_24h.json'
+
+# ========================================
+# PRÉDICTIONS DE SECOURS
+# ========================================
+
+def fallback_predictions(now):
+    """Prédictions par défaut quand le modèle n'a encore rien produit"""
+    predictions = []
+    for i in range(24):
+        pred_time = now + timedelta(hours=i+1)
+        predictions.append({
+            "time": pred_time.strftime('%H:%M'),
+            "timestamp": pred_time.isoformat(),
+            "aqi": 45 + (i % 10),
+            "pm25": 35.0 + (i % 8),
+            "confidence": 95 - (i * 2),
+            "level": "BON" if (45 + (i % 10)) < 50 else "MODÉRÉ",
+            "level_class": "success" if (45 + (i % 10)) < 50 else "warning"
+        })
+    return predictions
+
+def summarize(predictions):
+    if not predictions:
+        return None
+    aqis = [p['aqi'] for p in predictions]
+    return {
+        'count': len(aqis),
+        'avg_aqi': sum(aqis) / len(aqis),
+        'max_aqi': max(aqis),
+        'min_aqi': min(aqis)
+    }
+
+# ========================================
+# FOURNISSEUR
+# ========================================
+
+class PredictionsSnapshot:
+    def __init__(self, predictions, version, from_file):
+        self.predictions = predictions
+        self.summary = summarize(predictions)
+        self.version = version
+        self.from_file = from_file
+
+
+class PredictionsProvider:
+    """Prédictions parsées une fois par version du fichier"""
+
+    def __init__(self, path=PREDICTIONS_FILE):
+        self.path = path
+        self._snapshot = None
+        self._signature = None
+        self._fallback = None
+        self._lock = threading.Lock()
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get(self):
+        signature = self._stat()
+        if signature is None:
+            return self._get_fallback()
+        if signature == self._signature:
+            return self._snapshot
+
+        with self._lock:
+            if signature == self._signature:
+                return self._snapshot
+            try:
+                with open(self.path, 'rb') as f:
+                    content = f.read()
+                predictions = json.loads(content)
+                if not isinstance(predictions, list):
+                    raise ValueError("format inattendu")
+            except (OSError, ValueError) as e:
+                # Écriture en cours (JSON tronqué) : garder la version précédente
+                print(f"Prédictions non rechargées ({e})")
+                return self._snapshot or self._get_fallback()
+
+            # Le fichier a changé pendant la lecture : on réessaiera au prochain appel
+            if self._stat() != signature:
+                return self._snapshot or self._get_fallback()
+
+            self._snapshot = PredictionsSnapshot(
+                predictions, f"{signature[0]:x}-{signature[1]:x}", True)
+            self._signature = signature
+            return self._snapshot
+
+    def _get_fallback(self):
+        now = datetime.now()
+        hour = now.strftime('%Y%m%d%H')
+        fallback = self._fallback
+        if fallback is None or fallback.version != f"defaut-{hour}":
+            fallback = self._fallback = PredictionsSnapshot(
+                fallback_predictions(now), f"defaut-{hour}", False)
+        return fallback
@@ -0,0 +1,143 @@
+"""
+Statistiques des requêtes SQL - Smart City
+Journal des requêtes lentes (paramètres + EXPLAIN QUERY PLAN) et cumul
+par requête normalisée, pour savoir quels parcours indexer en premier
+"""
+
+import os
+import re
+import sqlite3
+import threading
+from functools import lru_cache
+
+# ========================================
+# CONFIGURATION
+# ========================================
+# Seuil au-delà duquel une requête est journalisée (millisecondes)
+SLOW_QUERY_MS = float(os.environ.get('SMARTCITY_SLOW_QUERY_MS', 100))
+# Requêtes normalisées distinctes suivies (les moins coûteuses sont évincées)
+MAX_TRACKED = 500
+TOP_N = 20
+# Longueur max de la représentation des paramètres dans le journal
+MAX_PARAMS_LENGTH = 500
+# Chaînes au moins aussi longues masquées dans le journal (jetons de session...)
+SECRET_MIN_LENGTH = 32
+
+# ========================================
+# NORMALISATION
+# ========================================
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACES = re.compile(r'\s+')
+
+@lru_cache(maxsize=2048)
+def normalize_sql(sql):
+    """Texte SQL sans littéraux ni espaces superflus : une entrée par forme de requête"""
+    text = _STRING.sub('?', sql)
+    text = _NUMBER.sub('?', text)
+    text = _IN_LIST.sub('(?, ...)', text)
+    return _SPACES.sub(' ', text).strip()
+
+def _first_parameters(parameters, is_many=False):
+    """Paramètres d'une exécution (le premier jeu pour executemany)"""
+    if is_many:
+        # Itérateur déjà consommé par executemany : aucun jeu à montrer
+        return parameters[0] if isinstance(parameters, (list, tuple)) and parameters else ()
+    if isinstance(parameters, (list, tuple, dict)):
+        return parameters
+    return ()
+
+def _hide(value):
+    if isinstance(value, str) and len(value) >= SECRET_MIN_LENGTH:
+        return f'<{len(value)} caracteres>'
+    return value
+
+def _redact(parameters, is_many=False):
+    """Paramètres lisibles pour le journal, secrets masqués, longueur bornée"""
+    shown = _first_parameters(parameters, is_many)
+    if isinstance(shown, dict):
+        text = repr({key: _hide(value) for key, value in shown.items()})
+    else:
+        text = repr(tuple(_hide(value) for value in shown))
+    if is_many:
+        count = len(parameters) if isinstance(parameters, (list, tuple)) else '?'
+        text = f"{count} jeux, premier : {text}"
+    return text if len(text) <= MAX_PARAMS_LENGTH else text[:MAX_PARAMS_LENGTH] + '...'
+
+# ========================================
+# PLAN D'EXÉCUTION
+# ========================================
+
+def explain(conn, sql, parameters=(), is_many=False):
+    """Lignes d'EXPLAIN QUERY PLAN, indentées selon l'arbre du plan"""
+    try:
+        # Curseur brut : ne pas se mesurer soi-même
+        cursor = conn.cursor(sqlite3.Cursor)
+        rows = cursor.execute('EXPLAIN QUERY PLAN ' + sql, _first_parameters(parameters, is_many)).fetchall()
+    except (sqlite3.Error, ValueError) as e:
+        return [f"(plan indisponible : {e})"]
+    depths = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depths[node_id] = depths.get(parent, -1) + 1
+        lines.append('  ' * depths[node_id] + detail)
+    return lines
+
+# ========================================
+# CUMULS
+# ========================================
+
+class QueryStats:
+    """Cumul par requête normalisée + journal des requêtes lentes (observateur db_pool)"""
+
+    def __init__(self, threshold_ms=SLOW_QUERY_MS, max_tracked=MAX_TRACKED):
+        self.threshold = threshold_ms / 1000
+        self.max_tracked = max_tracked
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, conn, sql, parameters, seconds, is_many=False):
+        key = normalize_sql(sql)
+        slow = seconds >= self.threshold
+        with self._lock:
+            entry = self._stats.get(key)
+            if entry is None:
+                if len(self._stats) >= self.max_tracked:
+                    del self._stats[min(self._stats, key=lambda k: self._stats[k]['total'])]
+                entry = self._stats[key] = {'calls': 0, 'total': 0.0, 'max': 0.0, 'slow': 0, 'plan': None}
+            entry['calls'] += 1
+            entry['total'] += seconds
+            entry['max'] = max(entry['max'], seconds)
+            if not slow:
+                return
+            entry['slow'] += 1
+            plan = entry['plan']
+
+        # Plan capturé à la première lenteur de chaque forme de requête
+        if plan is None:
+            plan = explain(conn, sql, parameters, is_many)
+            with self._lock:
+                entry['plan'] = plan
+        print(f"Requete lente ({seconds * 1000:.1f} ms) : {key}\n"
+              f"  parametres : {_redact(parameters, is_many)}\n"
+              f"  plan :\n    " + '\n    '.join(plan or ['(aucun)']))
+
+    def top(self, limit=TOP_N):
+        """Requêtes les plus coûteuses en temps cumulé"""
+        with self._lock:
+            items = sorted(self._stats.items(), key=lambda item: item[1]['total'], reverse=True)[:limit]
+            return [{
+                'sql': sql,
+                'calls': entry['calls'],
+                'total_ms': round(entry['total'] * 1000, 2),
+                'avg_ms': round(entry['total'] * 1000 / entry['calls'], 3),
+                'max_ms': round(entry['max'] * 1000, 2),
+                'slow_calls': entry['slow'],
+                'plan': entry['plan']
+            } for sql, entry in items]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
@@ -0,0 +1,125 @@
+"""
+Réponses brutes des API externes - Smart City
+Stockées hors des tables de mesures, compressées (zstd si disponible, sinon zlib)
+et dédupliquées par empreinte du contenu ; lues uniquement à la demande
+
+Dépendance optionnelle : zstandard (pip install zstandard)
+"""
+
+import hashlib
+import json
+import os
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# ========================================
+# CONFIGURATION
+# ========================================
+# Tables de mesures dont la ligne référence une réponse brute (colonne raw_id)
+RAW_TABLES = ('air_quality', 'weather')
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 9
+DEFAULT_CODEC = os.environ.get('SMARTCITY_RAW_CODEC', 'zstd' if zstandard is not None else 'zlib')
+
+MIGRATION_BATCH_SIZE = 5000
+
+# ========================================
+# COMPRESSION
+# ========================================
+
+def _compress(data, codec):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return zlib.compress(data, ZLIB_LEVEL)
+
+def _decompress(data, codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstandard est requis pour relire cette reponse brute (pip install zstandard)")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+# ========================================
+# SCHÉMA
+# ========================================
+
+def create_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS raw_payloads (
+            id INTEGER PRIMARY KEY,
+            hash BLOB NOT NULL UNIQUE,
+            codec TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            data BLOB NOT NULL
+        )
+    ''')
+
+# ========================================
+# ÉCRITURE / LECTURE
+# ========================================
+
+# Valeur de raw_id d'une ligne écrite après stage() : (?) = empreinte renvoyée
+ID_BY_HASH = '(SELECT id FROM raw_payloads WHERE hash = ?)'
+
+def _encode(payload):
+    """Texte JSON canonique (dict ou texte) en octets, et son empreinte SHA-256"""
+    if not isinstance(payload, str):
+        payload = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    data = payload.encode('utf-8')
+    return data, hashlib.sha256(data).digest()
+
+def store(cursor, payload, codec=DEFAULT_CODEC):
+    """Enregistrer une réponse (dict ou texte JSON) ; renvoie son id, partagé entre doublons"""
+    data, digest = _encode(payload)
+
+    cursor.execute('SELECT id FROM raw_payloads WHERE hash = ?', (digest,))
+    row = cursor.fetchone()
+    if row is not None:
+        return row[0]
+    cursor.execute('''
+        INSERT INTO raw_payloads (hash, codec, size, data) VALUES (?, ?, ?, ?)
+    ''', (digest, codec, len(data), _compress(data, codec)))
+    return cursor.lastrowid
+
+def stage(writer, payload, codec=DEFAULT_CODEC):
+    """Variante différée de store (tampon d'écriture) : renvoie l'empreinte, à passer à ID_BY_HASH"""
+    data, digest = _encode(payload)
+    writer.execute('''
+        INSERT OR IGNORE INTO raw_payloads (hash, codec, size, data) VALUES (?, ?, ?, ?)
+    ''', (digest, codec, len(data), _compress(data, codec)))
+    return digest
+
+def load(cursor, raw_id):
+    """Texte JSON d'origine, ou None si absent"""
+    cursor.execute('SELECT codec, data FROM raw_payloads WHERE id = ?', (raw_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return _decompress(row[1], row[0]).decode('utf-8')
+
+# ========================================
+# MIGRATION DES ANCIENNES LIGNES
+# ========================================
+
+def move_raw_data(cursor, table):
+    """Déplacer la colonne raw_data de table vers raw_payloads (raw_id) ; renvoie le nombre de lignes"""
+    moved = 0
+    last_id = 0
+    while True:
+        cursor.execute(f'''
+            SELECT id, raw_data FROM {table}
+            WHERE id > ? AND raw_data IS NOT NULL
+            ORDER BY id LIMIT ?
+        ''', (last_id, MIGRATION_BATCH_SIZE))
+        rows = cursor.fetchall()
+        if not rows:
+            return moved
+        updates = [(store(cursor, raw_data), row_id) for row_id, raw_data in rows]
+        cursor.executemany(f'UPDATE {table} SET raw_id = ? WHERE id = ?', updates)
+        moved += len(rows)
+        last_id = rows[-1][0]
@@ -0,0 +1,222 @@
+"""
+File de génération de rapports PDF - Smart City
+Génération asynchrone sur un pool de workers, suivi par identifiant de tâche
+Artefacts PDF mis en cache sur disque (clé : paramètres + seau de la période)
+État de chaque tâche écrit à côté de l'artefact : visible de tous les processus
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# ========================================
+# CONFIGURATION
+# ========================================
+REPORT_WORKERS = int(os.environ.get('SMARTCITY_REPORT_WORKERS', 2))
+REPORT_CACHE_DIR = os.environ.get('SMARTCITY_REPORT_CACHE_DIR', 'reports_cache')
+REPORT_CACHE_MAX_BYTES = int(os.environ.get('SMARTCITY_REPORT_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+# Durée de conservation du suivi des tâches terminées (mémoire et fichiers d'état)
+JOB_RETENTION_SECONDS = 3600
+# Tâche en attente / en cours dont l'état n'a pas bougé depuis : processus disparu
+JOB_STALE_SECONDS = 600
+
+STATUS_PENDING = 'en_attente'
+STATUS_RUNNING = 'en_cours'
+STATUS_DONE = 'termine'
+STATUS_FAILED = 'erreur'
+
+# ========================================
+# FILE DE TÂCHES
+# ========================================
+
+def job_key(params, bucket):
+    """Identifiant déterministe : même rapport, même seau de période -> même tâche"""
+    payload = json.dumps({'params': params, 'bucket': bucket}, sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+def is_job_key(value):
+    return len(value) == 40 and all(c in '0123456789abcdef' for c in value)
+
+
+class ReportJobs:
+    """Tâches de rendu PDF ; l'identifiant est aussi la clé du cache disque.
+    L'état (<id>.json) et l'artefact (<id>.pdf) sont sur disque : n'importe quel
+    processus peut suivre une tâche lancée par un autre et servir son rapport"""
+
+    def __init__(self, render, cache_dir=REPORT_CACHE_DIR, workers=REPORT_WORKERS,
+                 max_bytes=REPORT_CACHE_MAX_BYTES):
+        self.render = render
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.max_bytes = max_bytes
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def path(self, job_id):
+        return os.path.join(self.cache_dir, f"{job_id}.pdf")
+
+    def status_path(self, job_id):
+        return os.path.join(self.cache_dir, f"{job_id}.json")
+
+    def submit(self, params, bucket):
+        """Mettre en file un rendu (ou réutiliser la tâche / l'artefact existant)
+
+        bucket : seau de la période couverte ; un nouveau seau donne un nouveau rapport.
+        """
+        job_id = job_key(params, bucket)
+        with self._lock:
+            self._prune()
+            job = self._tracked(job_id)
+            if job is not None and job['status'] != STATUS_FAILED:
+                return dict(job)
+
+            # Tâche d'un autre processus : terminée (artefact) ou encore en cours
+            job = self._load(job_id)
+            if job is not None and job['status'] != STATUS_FAILED:
+                if job['status'] == STATUS_DONE:
+                    try:
+                        os.utime(self.path(job_id))
+                    except FileNotFoundError:
+                        pass
+                return job
+
+            job = {
+                'id': job_id,
+                'status': STATUS_PENDING,
+                'params': params,
+                'created_at': time.time(),
+                'finished_at': None,
+                'error': None
+            }
+            self._jobs[job_id] = job
+            self._save(job)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='report')
+            self._executor.submit(self._run, job_id)
+            return dict(job)
+
+    def get(self, job_id):
+        """État d'une tâche, suivie par ce processus ou lue sur disque (None si inconnue)"""
+        with self._lock:
+            job = self._tracked(job_id)
+            if job is not None:
+                return dict(job)
+        if not is_job_key(job_id):
+            return None
+        return self._load(job_id)
+
+    def _tracked(self, job_id):
+        """Tâche suivie en mémoire (sous self._lock) ; oubliée si son PDF a été évincé"""
+        job = self._jobs.get(job_id)
+        if job is not None and job['status'] == STATUS_DONE and not os.path.exists(self.path(job_id)):
+            del self._jobs[job_id]
+            return None
+        return job
+
+    def _load(self, job_id):
+        """État sur disque ; un artefact suffit à déclarer la tâche terminée"""
+        try:
+            with open(self.status_path(job_id), encoding='utf-8') as f:
+                job = json.load(f)
+            updated = os.path.getmtime(self.status_path(job_id))
+        except (FileNotFoundError, ValueError):
+            job, updated = None, None
+
+        if os.path.exists(self.path(job_id)):
+            job = job or {'id': job_id, 'params': None, 'created_at': None}
+            job['status'] = STATUS_DONE
+            job['error'] = None
+            job['finished_at'] = job.get('finished_at') or os.path.getmtime(self.path(job_id))
+            return job
+        # Terminée mais PDF évincé (par ce processus ou un autre) : tâche à relancer
+        if job is None or job['status'] == STATUS_DONE:
+            return None
+        if job['status'] in (STATUS_PENDING, STATUS_RUNNING) and time.time() - updated > JOB_STALE_SECONDS:
+            job['status'] = STATUS_FAILED
+            job['error'] = "tache interrompue"
+        return job
+
+    def _save(self, job):
+        """Écrire l'état de la tâche (remplacement atomique, sous self._lock)"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.status_path(job['id'])
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, path)
+
+    def wait(self, job_id, timeout=120):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = self.get(job_id)
+            if job is None or job['status'] in (STATUS_DONE, STATUS_FAILED):
+                return job
+            time.sleep(0.1)
+        return self.get(job_id)
+
+    def _run(self, job_id):
+        with self._lock:
+            job = self._jobs[job_id]
+            job['status'] = STATUS_RUNNING
+            params = job['params']
+            self._save(job)
+        try:
+            pdf = self.render(**params)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{self.path(job_id)}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(pdf)
+            os.replace(tmp_path, self.path(job_id))
+            self._evict()
+            status, error = STATUS_DONE, None
+        except Exception as e:
+            print(f"Erreur génération rapport: {e}")
+            status, error = STATUS_FAILED, str(e)
+        with self._lock:
+            job['status'] = status
+            job['error'] = error
+            job['finished_at'] = time.time()
+            self._save(job)
+
+    def _evict(self):
+        """Supprimer les PDF les moins récemment utilisés au-delà de max_bytes,
+        ainsi que les états sans artefact (échecs) plus vieux que JOB_RETENTION_SECONDS"""
+        entries = []
+        orphans = []
+        limit = time.time() - JOB_RETENTION_SECONDS
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if name.endswith('.pdf'):
+                entries.append((stat.st_mtime, stat.st_size, path))
+            elif (name.endswith('.json') and stat.st_mtime < limit
+                  and not os.path.exists(path[:-len('.json')] + '.pdf')):
+                orphans.append(path)
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            orphans.append(path[:-len('.pdf')] + '.json')
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+        for path in orphans:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _prune(self):
+        limit = time.time() - JOB_RETENTION_SECONDS
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job['finished_at'] is not None and job['finished_at'] < limit]:
+            del self._jobs[job_id]
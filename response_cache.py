@@ -0,0 +1,111 @@
+"""
+Cache de réponses - Smart City
+Réponses JSON mémorisées par (endpoint, filtres), LRU bornée en mémoire
+Invalidation par numéro de génération des données (bumpé par le collecteur)
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# ========================================
+# CONFIGURATION
+# ========================================
+RESPONSE_CACHE_ENTRIES = int(os.environ.get('SMARTCITY_RESPONSE_CACHE_ENTRIES', 512))
+RESPONSE_CACHE_BYTES = int(os.environ.get('SMARTCITY_RESPONSE_CACHE_BYTES', 64 * 1024 * 1024))
+# Les fenêtres glissantes ("dernière heure") bougent même sans écriture :
+# une entrée n'est jamais servie au-delà de cet âge
+RESPONSE_CACHE_MAX_AGE = float(os.environ.get('SMARTCITY_RESPONSE_CACHE_MAX_AGE', 30))
+
+# ========================================
+# CACHE
+# ========================================
+
+class ResponseCache:
+    """Cache LRU de corps de réponse, valide pour une génération de données"""
+
+    def __init__(self, max_entries=RESPONSE_CACHE_ENTRIES, max_bytes=RESPONSE_CACHE_BYTES,
+                 max_age=RESPONSE_CACHE_MAX_AGE):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            entry_version, created, value = entry
+            if entry_version != version or time.monotonic() - created > self.max_age:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, version, value):
+        size = _size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (version, time.monotonic(), value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def get_or_compute(self, key, version, compute):
+        """Une seule exécution de compute() par clé et génération, même sous concurrence
+
+        compute() renvoie (valeur, cacheable). Renvoie (valeur, hit).
+        """
+        while True:
+            value = self.get(key, version)
+            if value is not None:
+                self.hits += 1
+                return value, True
+
+            with self._lock:
+                waiter = self._inflight.get((key, version))
+                if waiter is None:
+                    waiter = self._inflight[(key, version)] = threading.Event()
+                    leader = True
+                else:
+                    leader = False
+
+            if not leader:
+                waiter.wait()
+                continue
+
+            try:
+                self.misses += 1
+                value, cacheable = compute()
+                if cacheable:
+                    self.put(key, version, value)
+                return value, False
+            finally:
+                with self._lock:
+                    del self._inflight[(key, version)]
+                waiter.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= _size(entry[2])
+
+
+def _size(value):
+    """Taille d'une valeur : corps bytes, ou tuple dont le premier élément est le corps"""
+    return len(value[0]) if isinstance(value, tuple) else len(value)
@@ -0,0 +1,291 @@
+"""
+Rétention des données - Smart City
+Purge par paliers (mesures brutes, agrégats minute, agrégats horaires et journaliers)
+en petites transactions, puis ANALYZE et vacuum incrémental pour rendre l'espace
+
+Les agrégats sont alimentés à l'insertion (rollups.record) : supprimer une mesure
+brute ne modifie aucune statistique tant que son palier d'agrégat est conservé.
+Avec pyarrow, chaque jour expiré est d'abord archivé en Parquet (archive.py) et
+seuls les jours archivés sont purgés : l'historique long reste disponible.
+
+Usage : python retention.py [--dry-run] [--vacuum]
+"""
+
+import argparse
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import archive
+import db_pool
+import raw_payloads
+import rollups
+
+# ========================================
+# CONFIGURATION
+# ========================================
+DB_NAME = "smartcity.db"
+
+def _days(table, default):
+    """Durée de conservation en jours (SMARTCITY_RETENTION_<TABLE>_DAYS, 0 = illimitée)"""
+    value = os.environ.get(f'SMARTCITY_RETENTION_{table.upper()}_DAYS')
+    days = float(value) if value not in (None, '') else default
+    return days if days else None
+
+# Table -> jours conservés (None : pour toujours)
+RAW_RETENTION = {
+    'air_quality': _days('air_quality', 7),
+    'weather': _days('weather', 7),
+    'iot_sensors': _days('iot_sensors', 7),
+    'alerts': _days('alerts', 90),
+}
+ROLLUP_RETENTION = {
+    'rollup_1m': _days('rollup_1m', 90),
+    'rollup_1h': _days('rollup_1h', 0),
+    'rollup_1d': _days('rollup_1d', 0),
+}
+
+# Lignes supprimées par transaction, et pause laissant passer les autres écrivains
+BATCH_SIZE = 2000
+BATCH_PAUSE_SECONDS = 0.05
+# Pages libérées par transaction de vacuum incrémental
+VACUUM_PAGES = 2048
+# Lignes lues par ANALYZE et par index (borne sa durée)
+ANALYSIS_LIMIT = 1000
+
+RETENTION_INTERVAL_SECONDS = int(os.environ.get('SMARTCITY_RETENTION_INTERVAL', 3600))
+
+# ========================================
+# PURGE
+# ========================================
+
+def _batch(conn, work):
+    """Exécuter work(cursor) dans sa propre transaction d'écriture"""
+    if conn.in_transaction:
+        conn.commit()
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        result = work(cursor)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    time.sleep(BATCH_PAUSE_SECONDS)
+    return result
+
+def _purge_payloads(cursor, raw_ids):
+    """Supprimer les réponses brutes qui ne sont plus référencées"""
+    unreferenced = ' AND '.join(
+        f'NOT EXISTS (SELECT 1 FROM {table} WHERE raw_id = raw_payloads.id)'
+        for table in raw_payloads.RAW_TABLES)
+    cursor.executemany(f'DELETE FROM raw_payloads WHERE id = ? AND {unreferenced}',
+                       [(raw_id,) for raw_id in raw_ids])
+
+def _day_start(day):
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp())
+
+def archive_expired(conn, table, cutoff, now, archive_dir=archive.ARCHIVE_DIR):
+    """Archiver les jours complets qui contiennent des lignes antérieures à cutoff
+
+    Renvoie la borne de purge : cutoff, ramené au début du jour courant
+    (un jour en cours n'est pas encore archivable) ou du premier jour en échec :
+    seuls les jours archivés sont purgés.
+    """
+    today = datetime.fromtimestamp(now, timezone.utc).date()
+    cutoff = min(cutoff, _day_start(today))
+    oldest = conn.execute(f'SELECT MIN(ts) FROM {table} WHERE ts < ?', (cutoff,)).fetchone()[0]
+    if oldest is None:
+        return cutoff
+    if conn.in_transaction:
+        conn.commit()
+
+    day = datetime.fromtimestamp(oldest, timezone.utc).date()
+    last = datetime.fromtimestamp(cutoff - 1, timezone.utc).date()
+    while day <= last:
+        if not os.path.exists(archive.partition_path(table, day, archive_dir)):
+            try:
+                count = archive.archive_day(conn, table, day, archive_dir)
+            except Exception as e:
+                print(f"Erreur archive {table} {day} (purge retenue a partir de ce jour): {e}")
+                return _day_start(day)
+            print(f"  archive {table} {day}: {count} lignes")
+        day += timedelta(days=1)
+    return cutoff
+
+def purge_table(conn, table, cutoff):
+    """Supprimer les mesures antérieures à cutoff (epoch) par lots, les plus anciennes d'abord"""
+    has_payloads = table in raw_payloads.RAW_TABLES
+    columns = 'id, raw_id' if has_payloads else 'id'
+
+    def work(cursor):
+        cursor.execute(f'SELECT {columns} FROM {table} WHERE ts < ? ORDER BY ts LIMIT ?',
+                       (cutoff, BATCH_SIZE))
+        rows = cursor.fetchall()
+        cursor.executemany(f'DELETE FROM {table} WHERE id = ?', [(row[0],) for row in rows])
+        if has_payloads:
+            _purge_payloads(cursor, {row[1] for row in rows if row[1] is not None})
+        return len(rows)
+
+    deleted = 0
+    while True:
+        count = _batch(conn, work)
+        deleted += count
+        if count < BATCH_SIZE:
+            return deleted
+
+def purge_rollup(conn, table, cutoff):
+    """Supprimer les seaux antérieurs à cutoff, polluant par polluant (index scope, pollutant, bucket)"""
+    series = {(scope, pollutant) for scope, (_, _, fields) in rollups.SCOPES.items() for pollutant in fields}
+
+    deleted = 0
+    for scope, pollutant in sorted(series):
+        def work(cursor):
+            cursor.execute(f'''
+                DELETE FROM {table}
+                WHERE (scope, scope_key, pollutant, bucket) IN (
+                    SELECT scope, scope_key, pollutant, bucket FROM {table}
+                    WHERE scope = ? AND pollutant = ? AND bucket < ?
+                    LIMIT ?
+                )
+            ''', (scope, pollutant, cutoff, BATCH_SIZE))
+            return cursor.rowcount
+
+        while True:
+            count = _batch(conn, work)
+            deleted += count
+            if count < BATCH_SIZE:
+                break
+    return deleted
+
+def count_expired(conn, now=None):
+    """Lignes qui seraient supprimées (--dry-run)"""
+    now = int(now or time.time())
+    counts = {}
+    for table, days in RAW_RETENTION.items():
+        if days is not None:
+            counts[table] = conn.execute(f'SELECT COUNT(*) FROM {table} WHERE ts < ?',
+                                         (now - int(days * 86400),)).fetchone()[0]
+    for table, days in ROLLUP_RETENTION.items():
+        if days is not None:
+            counts[table] = conn.execute(f'SELECT COUNT(*) FROM {table} WHERE bucket < ?',
+                                         (now - int(days * 86400),)).fetchone()[0]
+    return counts
+
+# ========================================
+# COMPACTAGE
+# ========================================
+
+def analyze(conn):
+    """Statistiques du planificateur à jour, durée bornée par analysis_limit"""
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+    conn.execute('ANALYZE')
+    conn.commit()
+
+def incremental_vacuum(conn):
+    """Rendre au système les pages libres, par tranches ; renvoie le nombre de pages libérées"""
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        return 0
+    if conn.in_transaction:
+        conn.commit()
+    freed = 0
+    free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    while free_pages:
+        # incremental_vacuum libère une page par pas d'exécution : executescript
+        # le mène à terme (execute() s'arrêterait au premier pas)
+        conn.executescript(f'PRAGMA incremental_vacuum({VACUUM_PAGES})')
+        remaining = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if remaining >= free_pages:
+            break
+        freed += free_pages - remaining
+        free_pages = remaining
+        time.sleep(BATCH_PAUSE_SECONDS)
+    return freed
+
+def enable_incremental_vacuum(conn):
+    """Conversion unique d'une base créée sans auto_vacuum : VACUUM complet (bloque les écritures)"""
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+
+# ========================================
+# EXÉCUTION
+# ========================================
+
+def run_retention(db_name=DB_NAME, now=None, archive_dir=archive.ARCHIVE_DIR):
+    """Appliquer toute la politique ; renvoie {table: lignes supprimées}"""
+    now = int(now or time.time())
+    conn = db_pool.connect(db_name)
+    try:
+        deleted = {}
+        for table, days in RAW_RETENTION.items():
+            if days is None:
+                continue
+            cutoff = now - int(days * 86400)
+            # Une table en échec ne bloque ni les autres tables ni le compactage
+            try:
+                if archive.pa is not None and table in archive.ARCHIVE_TABLES:
+                    cutoff = archive_expired(conn, table, cutoff, now, archive_dir)
+                deleted[table] = purge_table(conn, table, cutoff)
+            except Exception as e:
+                print(f"Erreur retention {table}: {e}")
+                deleted[table] = 0
+        for table, days in ROLLUP_RETENTION.items():
+            if days is not None:
+                deleted[table] = purge_rollup(conn, table, now - int(days * 86400))
+
+        # Historique d'alertes modifié : invalider caches et ETag de l'API
+        if any(deleted.values()):
+            _batch(conn, db_pool.bump_data_version)
+
+        analyze(conn)
+        freed = incremental_vacuum(conn)
+    finally:
+        conn.close()
+        db_pool.release_current(db_name)
+
+    summary = ', '.join(f"{table}: {count}" for table, count in deleted.items() if count)
+    print(f"Retention : {summary or 'rien a supprimer'} - {freed} pages liberees")
+    return deleted
+
+def start_worker(db_name=DB_NAME, interval=RETENTION_INTERVAL_SECONDS):
+    """Thread de fond appliquant la rétention périodiquement"""
+    def run():
+        while True:
+            try:
+                run_retention(db_name)
+            except Exception as e:
+                print(f"Erreur retention: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name='retention', daemon=True)
+    thread.start()
+    return thread
+
+# ========================================
+# PROGRAMME PRINCIPAL
+# ========================================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retention et compactage de la base")
+    parser.add_argument('--dry-run', action='store_true', help="compter sans supprimer")
+    parser.add_argument('--vacuum', action='store_true',
+                        help="activer le vacuum incremental sur une base existante (VACUUM complet, une fois)")
+    args = parser.parse_args()
+
+    if args.dry_run:
+        conn = db_pool.connect(DB_NAME)
+        for table, count in count_expired(conn).items():
+            print(f"  {table}: {count} lignes expirees")
+        conn.close()
+    else:
+        if args.vacuum:
+            conn = db_pool.connect(DB_NAME)
+            print("VACUUM complet en cours (ecritures bloquees pendant l'operation)...")
+            enable_incremental_vacuum(conn)
+            conn.close()
+        run_retention()
@@ -0,0 +1,150 @@
+"""
+Agrégats pré-calculés - Smart City
+Tables de cumul par minute / heure / jour (nombre, somme, min, max)
+par polluant, par ville, par station et par emplacement de capteur
+"""
+
+# ========================================
+# CONFIGURATION
+# ========================================
+
+# Niveaux d'agrégation : table -> taille du seau en secondes (du plus fin au plus grossier)
+LEVELS = [
+    ('rollup_1m', 60),
+    ('rollup_1h', 3600),
+    ('rollup_1d', 86400),
+]
+
+# Nombre minimum de seaux dans la fenêtre demandée : borne l'erreur due au
+# seau partiel de début de fenêtre à ~2%
+MIN_BUCKETS = 48
+
+# Portées agrégées : portée -> (table source, colonne clé, mesures)
+SCOPES = {
+    'city': ('air_quality', 'city', ('aqi', 'pm25', 'pm10', 'no2', 'o3', 'so2', 'co', 'nh3')),
+    'station': ('air_quality', 'station_id', ('aqi', 'pm25', 'pm10', 'no2', 'o3', 'so2', 'co', 'nh3')),
+    'sensor': ('iot_sensors', 'location_name', ('pm25', 'pm10', 'no2', 'o3', 'so2', 'co')),
+}
+
+# ========================================
+# SCHÉMA
+# ========================================
+
+def create_tables(cursor):
+    for table, _ in LEVELS:
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                scope TEXT NOT NULL,
+                scope_key TEXT NOT NULL,
+                pollutant TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                samples INTEGER NOT NULL,
+                total REAL NOT NULL,
+                min_value REAL,
+                max_value REAL,
+                PRIMARY KEY (scope, scope_key, pollutant, bucket)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute(f'''
+            CREATE INDEX IF NOT EXISTS idx_{table}_scope_pollutant_bucket
+            ON {table} (scope, pollutant, bucket)
+        ''')
+
+def _has_column(cursor, table, column):
+    cursor.execute(f'PRAGMA table_info({table})')
+    return column in [row[1] for row in cursor.fetchall()]
+
+def rebuild(cursor, since=0, scopes=None):
+    """Cumuler les mesures brutes depuis since (tables d'agrégats vides sur cette plage)
+
+    scopes : portées à recalculer (toutes par défaut) ; une portée dont la colonne clé
+    n'existe pas encore (base en cours de migration) est remplie par la migration qui la crée.
+    """
+    selected = {scope: spec for scope, spec in SCOPES.items()
+                if (scopes is None or scope in scopes) and _has_column(cursor, spec[0], spec[1])}
+    for table, size in LEVELS:
+        for scope, (source, key_column, fields) in selected.items():
+            for field in fields:
+                cursor.execute(f'''
+                    INSERT INTO {table}
+                    (scope, scope_key, pollutant, bucket, samples, total, min_value, max_value)
+                    SELECT ?, {key_column}, ?, (ts / {size}) * {size},
+                           COUNT({field}), SUM({field}), MIN({field}), MAX({field})
+                    FROM {source}
+                    WHERE ts >= ? AND {field} IS NOT NULL AND {key_column} IS NOT NULL
+                    GROUP BY {key_column}, ts / {size}
+                    ON CONFLICT (scope, scope_key, pollutant, bucket) DO UPDATE SET
+                        samples = samples + excluded.samples,
+                        total = total + excluded.total,
+                        min_value = MIN(min_value, excluded.min_value),
+                        max_value = MAX(max_value, excluded.max_value)
+                ''', (scope, field, since))
+
+# ========================================
+# MISE À JOUR INCRÉMENTALE (collecteur)
+# ========================================
+
+def record(cursor, scope, scope_key, ts, values):
+    """Ajouter une mesure aux trois niveaux, dans la transaction de l'insertion"""
+    samples = [(pollutant, value) for pollutant, value in values.items() if value is not None]
+    if not samples:
+        return
+    for table, size in LEVELS:
+        bucket = ts // size * size
+        cursor.executemany(f'''
+            INSERT INTO {table}
+            (scope, scope_key, pollutant, bucket, samples, total, min_value, max_value)
+            VALUES (?, ?, ?, ?, 1, ?, ?, ?)
+            ON CONFLICT (scope, scope_key, pollutant, bucket) DO UPDATE SET
+                samples = samples + excluded.samples,
+                total = total + excluded.total,
+                min_value = MIN(min_value, excluded.min_value),
+                max_value = MAX(max_value, excluded.max_value)
+        ''', [(scope, scope_key, pollutant, bucket, value, value, value)
+              for pollutant, value in samples])
+
+# ========================================
+# LECTURE (API)
+# ========================================
+
+def choose_level(window_seconds):
+    """Niveau le plus grossier offrant au moins MIN_BUCKETS seaux sur la fenêtre"""
+    chosen = LEVELS[0]
+    for table, size in LEVELS:
+        if window_seconds // size >= MIN_BUCKETS:
+            chosen = (table, size)
+    return chosen
+
+def aggregate(cursor, scope, since, until, pollutants, scope_key=None):
+    """Moyenne / min / max / nombre par polluant sur [since, until[
+
+    scope_key : une clé, ou une liste de clés cumulées ensemble (None : toutes).
+    Renvoie {polluant: {'count', 'avg', 'min', 'max'}} (valeurs None si aucune mesure).
+    """
+    table, size = choose_level(until - since)
+    placeholders = ', '.join('?' for _ in pollutants)
+    query = f'''
+        SELECT pollutant,
+               SUM(samples) as count,
+               SUM(total) / SUM(samples) as avg,
+               MIN(min_value) as min,
+               MAX(max_value) as max
+        FROM {table}
+        WHERE scope = ? AND pollutant IN ({placeholders})
+          AND bucket >= ? AND bucket < ?
+    '''
+    params = [scope, *pollutants, since // size * size, until]
+    if isinstance(scope_key, (list, tuple)):
+        query += f" AND scope_key IN ({', '.join('?' for _ in scope_key)})"
+        params.extend(scope_key)
+    elif scope_key is not None:
+        query += ' AND scope_key = ?'
+        params.append(scope_key)
+    query += ' GROUP BY pollutant'
+    cursor.execute(query, params)
+
+    result = {pollutant: {'count': 0, 'avg': None, 'min': None, 'max': None}
+              for pollutant in pollutants}
+    for row in cursor.fetchall():
+        result[row[0]] = {'count': row[1], 'avg': row[2], 'min': row[3], 'max': row[4]}
+    return result
@@ -0,0 +1,107 @@
+"""
+Ordonnanceur du collecteur - Smart City
+Ticks à cadence fixe alignés sur l'horloge (ex. toutes les 10 min à :00, :10, ...),
+un thread par tâche, dépassements ignorés ou regroupés, mesure du retard
+
+Une tâche plus longue que son intervalle ne décale pas les suivantes :
+  - 'skip'     : les ticks manqués sont abandonnés, reprise au prochain tick
+  - 'coalesce' : les ticks manqués sont regroupés en une seule exécution immédiate
+"""
+
+import threading
+import time
+
+POLICIES = ('skip', 'coalesce')
+
+# ========================================
+# TÂCHE
+# ========================================
+
+class Job:
+    def __init__(self, name, interval, func, policy='coalesce'):
+        if policy not in POLICIES:
+            raise ValueError(f"Politique de depassement inconnue : {policy}")
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.policy = policy
+        self.thread = None
+
+
+def next_boundary(now, interval):
+    """Premier multiple de interval (epoch) strictement postérieur à now"""
+    return (int(now // interval) + 1) * interval
+
+# ========================================
+# ORDONNANCEUR
+# ========================================
+
+class FixedRateScheduler:
+    """Exécute chaque tâche sur des ticks fixes alignés, dans son propre thread"""
+
+    def __init__(self, registry=None, prefix='smartcity_collector'):
+        self.jobs = []
+        self._stop = threading.Event()
+        self._lag = self._duration = self._missed = None
+        if registry is not None:
+            self._lag = registry.histogram(
+                f'{prefix}_schedule_lag_seconds', "Retard du demarrage sur le tick prevu", ('job',))
+            self._duration = registry.histogram(
+                f'{prefix}_cycle_seconds', "Duree d'execution d'une tache de collecte", ('job',))
+            self._missed = registry.counter(
+                f'{prefix}_missed_ticks_total', "Ticks non executes a l'heure (depassement)",
+                ('job', 'policy'))
+
+    def add(self, name, interval, func, policy='coalesce'):
+        job = Job(name, interval, func, policy)
+        self.jobs.append(job)
+        return job
+
+    def start(self):
+        for job in self.jobs:
+            job.thread = threading.Thread(target=self._run, args=(job,), name=f'job-{job.name}', daemon=True)
+            job.thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run_forever(self):
+        """Démarrer les tâches et attendre (Ctrl+C lève KeyboardInterrupt)"""
+        self.start()
+        while not self._stop.wait(1):
+            pass
+
+    def _run(self, job):
+        tick = next_boundary(time.time(), job.interval)
+        while True:
+            # Attente jusqu'au tick (réveil anticipé possible : on revérifie l'heure)
+            while True:
+                delay = tick - time.time()
+                if delay <= 0:
+                    break
+                if self._stop.wait(delay):
+                    return
+
+            started = time.time()
+            if self._lag is not None:
+                self._lag.observe(started - tick, job.name)
+            try:
+                job.func()
+            except Exception as e:
+                print(f"Erreur tache {job.name}: {e}")
+            finished = time.time()
+            if self._duration is not None:
+                self._duration.observe(finished - started, job.name)
+
+            # Cadence fixe : le tick suivant ne dépend pas de la durée d'exécution
+            tick += job.interval
+            if finished <= tick:
+                continue
+            missed = int((finished - tick) // job.interval) + 1
+            if self._missed is not None:
+                self._missed.inc(job.name, job.policy, amount=missed)
+            if job.policy == 'skip':
+                tick = next_boundary(finished, job.interval)
+            else:
+                # Une seule exécution de rattrapage, datée du dernier tick manqué
+                tick += (missed - 1) * job.interval
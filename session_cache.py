@@ -0,0 +1,107 @@
+"""
+Cache des sessions - Smart City
+Cache LRU borné (TTL) devant la table sessions pour require_auth
+Purge périodique des sessions expirées par lots
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+# ========================================
+# CONFIGURATION
+# ========================================
+SESSION_CACHE_SIZE = int(os.environ.get('SMARTCITY_SESSION_CACHE_SIZE', 10000))
+# Durée max pendant laquelle un jeton est accepté sans relire la base.
+# Borne aussi le délai de prise en compte d'un logout fait par un autre processus.
+SESSION_CACHE_TTL = float(os.environ.get('SMARTCITY_SESSION_CACHE_TTL', 60))
+
+SWEEP_INTERVAL_SECONDS = 600
+SWEEP_BATCH_SIZE = 500
+
+# ========================================
+# CACHE LRU
+# ========================================
+
+class SessionCache:
+    """Jeton -> user_id, avec expiration et éviction LRU"""
+
+    def __init__(self, max_entries=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            user_id, deadline = entry
+            if deadline <= time.monotonic():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return user_id
+
+    def put(self, token, user_id, expires_at):
+        """Mémoriser une session valide jusqu'à expires_at (ISO) au plus tard"""
+        remaining = (datetime.fromisoformat(expires_at) - datetime.now()).total_seconds()
+        ttl = min(self.ttl, remaining)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[token] = (user_id, time.monotonic() + ttl)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+# ========================================
+# PURGE DES SESSIONS EXPIRÉES
+# ========================================
+
+def purge_expired_sessions(conn, batch_size=SWEEP_BATCH_SIZE):
+    """Supprimer les sessions expirées par petites transactions"""
+    now = datetime.now().isoformat()
+    total = 0
+    while True:
+        cursor = conn.execute('''
+            DELETE FROM sessions WHERE id IN (
+                SELECT id FROM sessions WHERE expires_at <= ? LIMIT ?
+            )
+        ''', (now, batch_size))
+        conn.commit()
+        total += cursor.rowcount
+        if cursor.rowcount < batch_size:
+            return total
+
+def start_sweeper(get_connection, interval=SWEEP_INTERVAL_SECONDS):
+    """Lancer la purge périodique dans un thread démon"""
+
+    def run():
+        while True:
+            try:
+                conn = get_connection()
+                try:
+                    deleted = purge_expired_sessions(conn)
+                finally:
+                    conn.close()
+                if deleted:
+                    print(f"Sessions expirees supprimees: {deleted}")
+            except Exception as e:
+                print(f"Erreur purge sessions: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name='session-sweeper', daemon=True)
+    thread.start()
+    return thread
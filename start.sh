@@ -4,6 +4,12 @@ set -euo pipefail
 # SMART CITY - Démarrage des serveurs (macOS/Linux)
 # Équivalent de start.bat (Windows)
 
+# Option --prod : backend servi par gunicorn (wsgi.py / gunicorn.conf.py)
+PROD_MODE=0
+if [[ "${1:-}" == "--prod" ]]; then
+  PROD_MODE=1
+fi
+
 ROOT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 
 echo "======================================"
@@ -29,6 +35,9 @@ else
 fi
 
 need_cmd npm
+if [[ "$PROD_MODE" == 1 ]]; then
+  need_cmd gunicorn
+fi
 
 BACKEND_DIR="$ROOT_DIR/backend"
 FRONTEND_DIR="$ROOT_DIR/frontend"
@@ -59,7 +68,11 @@ trap cleanup EXIT INT TERM
 echo "[1/3] Démarrage du backend (Python Flask)..."
 (
   cd "$BACKEND_DIR"
-  "$PY_BIN" api_backend.py
+  if [[ "$PROD_MODE" == 1 ]]; then
+    gunicorn -c gunicorn.conf.py wsgi:application
+  else
+    "$PY_BIN" api_backend.py
+  fi
 ) >"$ROOT_DIR/.logs/backend.log" 2>&1 &
 BACKEND_PID=$!
 
@@ -0,0 +1,130 @@
+"""
+Stations surveillées - Smart City
+Liste des stations collectées : fichier stations.json (ou SMARTCITY_STATIONS_FILE),
+recopié dans la table stations ; sans fichier, la table fait référence
+
+Chaque station : id (unique), city, name, lat, lon et, optionnel, waqi (flux WAQI :
+nom de ville, "@<uid>" d'une station ; par défaut "geo:<lat>;<lon>")
+"""
+
+import json
+import os
+
+import db_pool
+
+# ========================================
+# CONFIGURATION
+# ========================================
+STATIONS_FILE = os.environ.get('SMARTCITY_STATIONS_FILE', 'stations.json')
+
+# Station des mesures antérieures à la collecte multi-stations (collecteur limité à Paris)
+LEGACY_STATION = {
+    'id': 'paris',
+    'city': 'paris',
+    'name': 'Paris',
+    'lat': 48.8566,
+    'lon': 2.3522,
+    'waqi': 'paris',
+}
+
+REQUIRED_FIELDS = ('id', 'city', 'lat', 'lon')
+
+# ========================================
+# SCHÉMA
+# ========================================
+
+def create_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stations (
+            id TEXT PRIMARY KEY,
+            city TEXT NOT NULL,
+            name TEXT,
+            lat REAL NOT NULL,
+            lon REAL NOT NULL,
+            waqi TEXT NOT NULL,
+            enabled INTEGER NOT NULL DEFAULT 1
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_stations_city ON stations (city)')
+
+# ========================================
+# LISTE
+# ========================================
+
+def normalize(station):
+    """Station complétée (nom, flux WAQI) ; ValueError si un champ obligatoire manque"""
+    missing = [field for field in REQUIRED_FIELDS if station.get(field) in (None, '')]
+    if missing:
+        raise ValueError(f"Station {station.get('id', '?')} : champ(s) manquant(s) {', '.join(missing)}")
+    return {
+        'id': str(station['id']),
+        'city': str(station['city']).lower(),
+        'name': station.get('name') or str(station['id']),
+        'lat': float(station['lat']),
+        'lon': float(station['lon']),
+        'waqi': station.get('waqi') or f"geo:{station['lat']};{station['lon']}",
+    }
+
+def load_file(path=STATIONS_FILE):
+    """Stations du fichier JSON (liste d'objets), ou None si le fichier n'existe pas"""
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        stations = [normalize(station) for station in json.load(f)]
+    ids = [station['id'] for station in stations]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"{path} : identifiants de station en double")
+    return stations
+
+def sync(cursor, stations):
+    """Recopier les stations dans la table ; celles retirées de la liste sont désactivées"""
+    cursor.executemany('''
+        INSERT INTO stations (id, city, name, lat, lon, waqi, enabled)
+        VALUES (:id, :city, :name, :lat, :lon, :waqi, 1)
+        ON CONFLICT (id) DO UPDATE SET
+            city = excluded.city, name = excluded.name, lat = excluded.lat,
+            lon = excluded.lon, waqi = excluded.waqi, enabled = 1
+    ''', stations)
+    placeholders = ', '.join('?' for _ in stations)
+    cursor.execute(f'UPDATE stations SET enabled = 0 WHERE id NOT IN ({placeholders})',
+                   [station['id'] for station in stations])
+
+def configure(db_name, path=STATIONS_FILE):
+    """Stations à collecter : le fichier s'il existe (recopié en base), sinon la table"""
+    stations = load_file(path)
+    conn = db_pool.connect(db_name)
+    try:
+        cursor = conn.cursor()
+        if stations is None:
+            cursor.execute('SELECT id, city, name, lat, lon, waqi FROM stations WHERE enabled = 1 ORDER BY id')
+            columns = [description[0] for description in cursor.description]
+            stations = [dict(zip(columns, row)) for row in cursor.fetchall()] or [LEGACY_STATION]
+        sync(cursor, stations)
+        conn.commit()
+    finally:
+        conn.close()
+    return stations
+
+# ========================================
+# FILTRES (API)
+# ========================================
+
+def resolve(cursor, city=None, station=None):
+    """Identifiants des stations retenues par les filtres city / station (None : aucun filtre)"""
+    if not city and not station:
+        return None
+    clauses = []
+    params = []
+    if city:
+        clauses.append('city = ?')
+        params.append(city.lower())
+    if station:
+        clauses.append('id = ?')
+        params.append(station)
+    cursor.execute(f"SELECT id FROM stations WHERE {' AND '.join(clauses)} ORDER BY id", params)
+    return [row[0] for row in cursor.fetchall()]
+
+def list_all(cursor):
+    cursor.execute('SELECT id, city, name, lat, lon, enabled FROM stations ORDER BY city, id')
+    columns = [description[0] for description in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
@@ -0,0 +1,56 @@
+"""
+Tests du journal des requêtes : paramètres d'un execute passés en liste,
+requêtes lues par un seul fetchone()
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_pool
+import query_stats
+
+
+def test_list_parameters_of_execute_are_one_set(tmp_path, capsys):
+    db_name = str(tmp_path / 'test.db')
+    stats = query_stats.QueryStats(threshold_ms=0)
+    db_pool.query_observers.append(stats.record)
+    try:
+        conn = db_pool.connect(db_name)
+        conn.execute('CREATE TABLE stations (id TEXT, city TEXT)')
+        conn.executemany('INSERT INTO stations VALUES (?, ?)', [('paris', 'paris'), ('lyon-1', 'lyon')])
+        rows = conn.execute('SELECT id FROM stations WHERE city = ? AND id != ?', ['paris', 'x']).fetchall()
+        conn.close()
+    finally:
+        db_pool.query_observers.remove(stats.record)
+        db_pool.close_pools()
+
+    assert rows == [('paris',)]
+    output = capsys.readouterr().out
+    assert "parametres : ('paris', 'x')" in output
+    assert "2 jeux, premier : ('paris', 'paris')" in output
+    assert 'Incorrect number of bindings' not in output
+    select = next(entry for entry in stats.top() if entry['sql'].startswith('SELECT'))
+    assert select['plan'] and 'SCAN stations' in select['plan'][0]
+
+
+def test_fetchone_then_dropped_cursor_is_recorded(tmp_path):
+    db_name = str(tmp_path / 'test.db')
+    stats = query_stats.QueryStats(threshold_ms=60000)
+    db_pool.query_observers.append(stats.record)
+    try:
+        conn = db_pool.connect(db_name)
+        conn.execute('CREATE TABLE data_version (id INTEGER PRIMARY KEY, generation INTEGER)')
+        conn.execute('INSERT INTO data_version VALUES (1, 7)')
+        version = db_pool.get_data_version(conn)
+        count = conn.execute('SELECT COUNT(*) FROM data_version').fetchone()[0]
+        conn.close()
+    finally:
+        db_pool.query_observers.remove(stats.record)
+        db_pool.close_pools()
+
+    assert (version, count) == (7, 1)
+    calls = {entry['sql']: entry['calls'] for entry in stats.top()}
+    assert calls.get('SELECT generation FROM data_version WHERE id = ?') == 1
+    assert calls.get('SELECT COUNT(*) FROM data_version') == 1
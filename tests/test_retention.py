@@ -0,0 +1,97 @@
+"""
+Tests de la rétention : archivage Parquet avant purge, valeurs non numériques
+("aqi": "-" de WAQI) et jour impossible à archiver
+"""
+
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip('pyarrow')
+
+import archive
+import db_pool
+import migrations
+import raw_payloads
+import retention
+import rollups
+
+DAY = 86400
+
+
+def create_database(db_name, now):
+    conn = db_pool.connect(db_name)
+    cursor = conn.cursor()
+    cursor.execute('CREATE TABLE air_quality (id INTEGER PRIMARY KEY, ts INTEGER, city TEXT, '
+                   'aqi INTEGER, pm25 REAL, raw_id INTEGER)')
+    cursor.execute('CREATE TABLE weather (id INTEGER PRIMARY KEY, ts INTEGER, temperature REAL, raw_id INTEGER)')
+    cursor.execute('CREATE TABLE iot_sensors (id INTEGER PRIMARY KEY, ts INTEGER, pm25 REAL)')
+    cursor.execute('CREATE TABLE alerts (id INTEGER PRIMARY KEY, ts INTEGER, value REAL)')
+    raw_payloads.create_table(cursor)
+    rollups.create_tables(cursor)
+    migrations.migrate_data_version(cursor)
+
+    old = now - 10 * DAY
+    cursor.executemany('INSERT INTO air_quality (ts, city, aqi, pm25) VALUES (?, ?, ?, ?)',
+                       [(old, 'paris', '-', '-'), (old + 60, 'paris', 42, 12.5), (now, 'paris', 40, 11.0)])
+    cursor.executemany('INSERT INTO weather (ts, temperature) VALUES (?, ?)', [(old, 12.0), (now, 14.0)])
+    conn.commit()
+    conn.close()
+
+
+def row_counts(db_name):
+    conn = db_pool.connect(db_name)
+    try:
+        return {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                for table in ('air_quality', 'weather')}
+    finally:
+        conn.close()
+
+
+def test_malformed_row_is_archived_then_purged(tmp_path, monkeypatch):
+    db_name = str(tmp_path / 'test.db')
+    archive_dir = str(tmp_path / 'archive')
+    now = int(time.time())
+    create_database(db_name, now)
+    monkeypatch.setattr(retention, 'BATCH_PAUSE_SECONDS', 0)
+    try:
+        deleted = retention.run_retention(db_name, now, archive_dir=archive_dir)
+        counts = row_counts(db_name)
+    finally:
+        db_pool.close_pools()
+
+    assert deleted['air_quality'] == 2 and deleted['weather'] == 1
+    assert counts == {'air_quality': 1, 'weather': 1}
+    day = datetime.fromtimestamp(now - 10 * DAY, timezone.utc).date()
+    archived = archive.load_table('air_quality', day, day + timedelta(days=1), archive_dir=archive_dir)
+    assert archived.column('aqi').to_pylist() == [None, 42]
+    assert not [name for name in os.listdir(os.path.join(archive_dir, 'air_quality')) if name.endswith('.tmp')]
+
+
+def test_failed_partition_only_holds_back_its_table(tmp_path, monkeypatch):
+    db_name = str(tmp_path / 'test.db')
+    archive_dir = str(tmp_path / 'archive')
+    now = int(time.time())
+    create_database(db_name, now)
+    monkeypatch.setattr(retention, 'BATCH_PAUSE_SECONDS', 0)
+    archive_day = archive.archive_day
+
+    def failing_archive_day(conn, table, day, archive_dir):
+        if table == 'air_quality':
+            raise ValueError("partition illisible")
+        return archive_day(conn, table, day, archive_dir)
+
+    monkeypatch.setattr(archive, 'archive_day', failing_archive_day)
+    try:
+        deleted = retention.run_retention(db_name, now, archive_dir=archive_dir)
+        counts = row_counts(db_name)
+    finally:
+        db_pool.close_pools()
+
+    assert deleted['air_quality'] == 0 and deleted['weather'] == 1
+    assert counts == {'air_quality': 3, 'weather': 1}
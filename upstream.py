@@ -0,0 +1,234 @@
+"""
+Client des API externes - Smart City
+Sessions HTTP persistantes (keep-alive) par fournisseur, débit global limité par
+fournisseur (seau à jetons), nouvelles tentatives avec backoff exponentiel et gigue
+sur 429 / 5xx, et cache de fraîcheur : on n'interroge pas un fournisseur avant sa
+prochaine mise à jour probable
+
+Fraîcheur d'une réponse :
+  - requête conditionnelle (If-None-Match / If-Modified-Since) quand le fournisseur
+    a renvoyé ETag / Last-Modified ; 304 = inchangé
+  - horodatage de la mesure dans le corps (WAQI data.time.v, OpenWeather dt) :
+    même horodatage = inchangé ; après un changement, pas de nouvel appel avant
+    la période de rafraîchissement du fournisseur
+"""
+
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# ========================================
+# CONFIGURATION
+# ========================================
+MAX_RETRIES = 3
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 8
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Reprise des appels un peu avant la mise à jour attendue (fraction de la période)
+EARLY_FRACTION = 0.1
+POOL_SIZE = 4
+
+# ========================================
+# FOURNISSEURS
+# ========================================
+
+class Provider:
+    """Fournisseur : période de mise à jour, horodatage d'une réponse et débit autorisé
+
+    Débit (appels/s) et rafale réglables par SMARTCITY_RATE_<NOM> et SMARTCITY_BURST_<NOM>.
+    """
+
+    def __init__(self, name, refresh_seconds, data_time, rate, burst):
+        self.name = name
+        self.refresh_seconds = refresh_seconds
+        self.data_time = data_time
+        self.rate = float(os.environ.get(f'SMARTCITY_RATE_{name.upper()}', rate))
+        self.burst = float(os.environ.get(f'SMARTCITY_BURST_{name.upper()}', burst))
+
+
+def _waqi_time(data):
+    return data.get('data', {}).get('time', {}).get('v') if data.get('status') == 'ok' else None
+
+def _openweather_time(data):
+    return data.get('dt')
+
+PROVIDERS = {
+    # Stations WAQI : mesures horaires
+    'waqi': Provider('waqi', 3600, _waqi_time, rate=5, burst=10),
+    # OpenWeather (offre gratuite : 60 appels / min) : observations rafraîchies toutes les ~10 minutes
+    'openweather': Provider('openweather', 600, _openweather_time, rate=1, burst=5),
+}
+
+
+class RateLimited(Exception):
+    """Pas de jeton disponible avant l'échéance : appel reporté au cycle suivant"""
+
+
+class TokenBucket:
+    """Seau à jetons : rate jetons par seconde, au plus burst d'avance (thread-safe)"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline=None):
+        """Prendre un jeton, en attendant au besoin ; False si impossible avant deadline (monotonic)"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if deadline is not None and now + wait > deadline:
+                return False
+            # Jeton réservé tout de suite (solde éventuellement négatif) : les appelants
+            # suivants attendent leur tour, l'attente se fait hors verrou
+            self._tokens -= 1
+        if wait:
+            time.sleep(wait)
+        return True
+
+
+class Freshness:
+    """État de fraîcheur d'une ressource (URL + paramètres)"""
+
+    def __init__(self):
+        self.etag = None
+        self.last_modified = None
+        self.data_time = None
+        self.next_check = 0.0
+
+# ========================================
+# CLIENT
+# ========================================
+
+class UpstreamClient:
+    """Appels GET JSON partagés par les tâches du collecteur (thread-safe)"""
+
+    def __init__(self, registry=None, prefix='smartcity_collector', verify=True):
+        self.verify = verify
+        self._sessions = {}
+        self._buckets = {name: TokenBucket(spec.rate, spec.burst) for name, spec in PROVIDERS.items()}
+        self._freshness = {}
+        self._lock = threading.Lock()
+        self._latency = self._requests = self._unchanged = self._throttled = None
+        if registry is not None:
+            self._latency = registry.histogram(
+                f'{prefix}_upstream_seconds', "Latence des API externes", ('source',))
+            self._requests = registry.counter(
+                f'{prefix}_upstream_requests_total', "Appels aux API externes par statut HTTP",
+                ('source', 'status'))
+            self._unchanged = registry.counter(
+                f'{prefix}_upstream_unchanged_total', "Donnees non rafraichies par le fournisseur",
+                ('source', 'reason'))
+            self._throttled = registry.counter(
+                f'{prefix}_upstream_throttled_total', "Appels reportes faute de jeton (limite de debit)",
+                ('source',))
+
+    def session(self, provider):
+        """Session keep-alive du fournisseur (connexions TLS réutilisées)"""
+        with self._lock:
+            session = self._sessions.get(provider)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.verify = self.verify
+                self._sessions[provider] = session
+            return session
+
+    def _state(self, key):
+        with self._lock:
+            state = self._freshness.get(key)
+            if state is None:
+                state = self._freshness[key] = Freshness()
+            return state
+
+    def _count_unchanged(self, provider, reason):
+        if self._unchanged is not None:
+            self._unchanged.inc(provider, reason)
+
+    def get_json(self, provider, url, params=None, timeout=10, deadline=None):
+        """Réponse JSON, ou None si le fournisseur n'a pas de donnée plus récente
+
+        timeout borne chaque appel, deadline (monotonic) l'attente d'un jeton du limiteur.
+        Lève RateLimited si aucun jeton n'est disponible avant deadline, et
+        requests.RequestException si l'appel échoue encore après les nouvelles tentatives.
+        """
+        spec = PROVIDERS[provider]
+        key = (url, tuple(sorted((params or {}).items())))
+        state = self._state(key)
+        now = time.time()
+        if now < state.next_check:
+            self._count_unchanged(provider, 'attente')
+            return None
+
+        headers = {}
+        if state.etag:
+            headers['If-None-Match'] = state.etag
+        if state.last_modified:
+            headers['If-Modified-Since'] = state.last_modified
+
+        response = self._get(provider, url, params, headers, timeout, deadline)
+        if response.status_code == 304:
+            self._count_unchanged(provider, '304')
+            return None
+        response.raise_for_status()
+        data = response.json()
+
+        state.etag = response.headers.get('ETag')
+        state.last_modified = response.headers.get('Last-Modified')
+        data_time = spec.data_time(data)
+        if data_time is not None:
+            if data_time == state.data_time:
+                self._count_unchanged(provider, 'horodatage')
+                return None
+            state.data_time = data_time
+            state.next_check = now + spec.refresh_seconds * (1 - EARLY_FRACTION)
+        return data
+
+    def _get(self, provider, url, params, headers, timeout, token_deadline):
+        """GET avec nouvelles tentatives (429 / 5xx / erreur réseau), chacune soumise au limiteur"""
+        session = self.session(provider)
+        bucket = self._buckets[provider]
+        if not bucket.acquire(token_deadline):
+            if self._throttled is not None:
+                self._throttled.inc(provider)
+            raise RateLimited(f"{provider} : limite de debit atteinte")
+        # timeout décompté à partir du premier appel effectif, nouvelles tentatives comprises
+        deadline = time.monotonic() + timeout
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            started = time.perf_counter()
+            try:
+                response = session.get(url, params=params, headers=headers, timeout=max(0.1, remaining))
+                status = response.status_code
+            except (requests.ConnectionError, requests.Timeout):
+                response, status = None, 'erreur'
+            if self._latency is not None:
+                self._latency.observe(time.perf_counter() - started, provider)
+                self._requests.inc(provider, status)
+
+            if response is not None and status not in RETRY_STATUSES:
+                return response
+
+            # Backoff exponentiel à gigue complète, Retry-After prioritaire
+            delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+            retry_after = response.headers.get('Retry-After') if response is not None else None
+            if retry_after and retry_after.isdigit():
+                delay = int(retry_after)
+            attempt += 1
+            if (attempt > MAX_RETRIES or time.monotonic() + delay >= deadline
+                    or not bucket.acquire(deadline - delay)):
+                if response is None:
+                    raise requests.ConnectionError(f"{provider} injoignable apres {attempt} tentative(s)")
+                return response
+            time.sleep(delay)
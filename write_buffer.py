@@ -0,0 +1,183 @@
+"""
+Tampon d'écriture groupée - Smart City
+Les lignes du collecteur (mesures, agrégats, alertes, réponses brutes) sont accumulées
+en mémoire puis écrites par executemany dans une seule transaction : un fsync et une
+courte prise du verrou d'écriture par vidage, au lieu d'un par mesure
+
+Vidage dès MAX_ROWS lignes en attente ou MAX_DELAY secondes après la plus ancienne.
+Les instructions sont rejouées dans l'ordre de leur première apparition : une ligne
+peut dépendre d'une instruction ajoutée avant elle (ex. réponse brute puis mesure).
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+import db_pool
+
+# ========================================
+# CONFIGURATION
+# ========================================
+MAX_ROWS = int(os.environ.get('SMARTCITY_WRITE_BUFFER_ROWS', 500))
+MAX_DELAY = float(os.environ.get('SMARTCITY_WRITE_BUFFER_DELAY', 2.0))
+# Au-delà (écritures en échec répété), les lignes d'un vidage raté sont abandonnées
+MAX_PENDING_ROWS = 20 * MAX_ROWS
+
+ROWS_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 5000)
+
+# ========================================
+# LOT D'UNE SOURCE
+# ========================================
+
+class Batch:
+    """Lignes d'une source : remises au tampon seulement si toute la source a réussi
+
+    Expose execute / executemany comme un curseur, pour les fonctions d'écriture existantes.
+    """
+
+    def __init__(self):
+        self.statements = {}
+        self.rows = 0
+
+    def execute(self, sql, parameters=()):
+        self.executemany(sql, [parameters])
+
+    def executemany(self, sql, seq_of_parameters):
+        rows = list(seq_of_parameters)
+        self.statements.setdefault(sql, []).extend(rows)
+        self.rows += len(rows)
+
+# ========================================
+# TAMPON
+# ========================================
+
+class WriteBuffer:
+    """Écritures groupées vers une base, vidées par taille ou par délai (thread-safe)"""
+
+    def __init__(self, db_name, max_rows=MAX_ROWS, max_delay=MAX_DELAY,
+                 registry=None, prefix='smartcity_collector'):
+        self.db_name = db_name
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self._statements = {}
+        self._rows = 0
+        self._oldest = None
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._thread = None
+        self._flush_rows = self._flush_seconds = self._pending = None
+        if registry is not None:
+            self._flush_rows = registry.histogram(
+                f'{prefix}_flush_rows', "Lignes ecrites par vidage du tampon", buckets=ROWS_BUCKETS)
+            self._flush_seconds = registry.histogram(
+                f'{prefix}_flush_seconds', "Duree d'un vidage du tampon (transaction comprise)")
+            self._pending = registry.gauge(
+                f'{prefix}_write_buffer_rows', "Lignes en attente d'ecriture")
+
+    @property
+    def pending(self):
+        return self._rows
+
+    def add(self, batch):
+        """Ajouter les lignes d'un lot ; vide aussitôt si MAX_ROWS est atteint"""
+        if not batch.rows:
+            return
+        with self._cond:
+            self._merge(batch.statements, batch.rows)
+            full = self._rows >= self.max_rows
+        if full:
+            self.flush()
+
+    def _merge(self, statements, rows, front=False):
+        """Fusionner des instructions dans l'attente (sous self._cond)"""
+        if front:
+            merged = {sql: list(params) for sql, params in statements.items()}
+            for sql, params in self._statements.items():
+                merged.setdefault(sql, []).extend(params)
+            self._statements = merged
+        else:
+            for sql, params in statements.items():
+                self._statements.setdefault(sql, []).extend(params)
+        self._rows += rows
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+            self._cond.notify()
+        if self._pending is not None:
+            self._pending.set(self._rows)
+
+    def flush(self):
+        """Écrire tout ce qui est en attente en une transaction ; renvoie le nombre de lignes"""
+        with self._flush_lock:
+            with self._cond:
+                statements, rows = self._statements, self._rows
+                self._statements, self._rows, self._oldest = {}, 0, None
+            if not rows:
+                return 0
+
+            started = time.perf_counter()
+            conn = db_pool.connect(self.db_name)
+            try:
+                cursor = conn.cursor()
+                # IMMEDIATE : verrou d'écriture pris d'emblée (busy_timeout plutôt qu'un échec en cours)
+                cursor.execute('BEGIN IMMEDIATE')
+                for sql, params in statements.items():
+                    cursor.executemany(sql, params)
+                # Une génération de données par vidage : invalide caches et ETag de l'API
+                db_pool.bump_data_version(cursor)
+                conn.commit()
+            except sqlite3.Error as e:
+                conn.rollback()
+                with self._cond:
+                    if self._rows + rows <= MAX_PENDING_ROWS:
+                        self._merge(statements, rows, front=True)
+                        print(f"Erreur ecriture ({rows} lignes remises en attente): {e}")
+                    else:
+                        print(f"Erreur ecriture ({rows} lignes abandonnees): {e}")
+                return 0
+            finally:
+                conn.close()
+
+            if self._flush_rows is not None:
+                self._flush_rows.observe(rows)
+                self._flush_seconds.observe(time.perf_counter() - started)
+                self._pending.set(self._rows)
+            return rows
+
+    # ========================================
+    # VIDAGE PAR DÉLAI
+    # ========================================
+
+    def start(self):
+        """Thread de fond vidant le tampon MAX_DELAY secondes après la plus ancienne ligne"""
+        self._thread = threading.Thread(target=self._run, name='write-buffer', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def _run(self):
+        with self._cond:
+            while not self._closed:
+                if self._oldest is None:
+                    self._cond.wait()
+                    continue
+                delay = self._oldest + self.max_delay - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                self._cond.release()
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"Erreur vidage du tampon: {e}")
+                finally:
+                    self._cond.acquire()
+
+    def close(self):
+        """Arrêter le thread de fond et écrire le reliquat"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
@@ -0,0 +1,38 @@
+"""
+Point d'entrée production - Smart City
+Serveur WSGI multi-processus / multi-threads (gunicorn, configuration : gunicorn.conf.py)
+
+Lancement : gunicorn -c gunicorn.conf.py wsgi:application
+Nouveau code sans coupure : kill -USR2 $(cat .gunicorn.pid) (nouveau maître),
+puis kill -TERM $(cat .gunicorn.pid.oldbin) (ancien maître). HUP ne suffit pas :
+avec preload_app, les workers relancés repartent du code chargé par le maître.
+
+L'état partagé (schéma, prédictions, dernières mesures) est préchargé une fois
+dans le processus maître avant le fork ; chaque worker ouvre ensuite ses propres
+connexions SQLite et démarre ses threads de fond (post_fork).
+"""
+
+import os
+
+import db_pool
+import api_backend
+from api_backend import app, init_database, get_db_connection, latest_readings, predictions_provider
+from session_cache import start_sweeper
+
+application = app
+
+def preload():
+    """Exécuté une fois dans le maître (preload_app = True)"""
+    init_database()
+    predictions_provider.get()
+    latest_readings()
+    # Aucune connexion ouverte ne doit être héritée par les workers
+    db_pool.close_pools()
+
+def start_worker_services():
+    """Exécuté dans chaque worker après le fork"""
+    start_sweeper(get_db_connection)
+    api_backend.start_metrics_export(f'api-{os.getpid()}')
+    print(f"Worker pret (pool SQLite : {db_pool.POOL_SIZE} connexions, base : {api_backend.DB_NAME})")
+
+preload()